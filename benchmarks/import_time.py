@@ -0,0 +1,95 @@
+"""Measure how long a fresh interpreter takes to import the app.
+
+Compares a cold start that only imports ``payments_service.views`` (provider
+SDKs load on first use) with one that also resolves every provider in the
+registry, which is what every cold start paid before the registry was lazy.
+
+    python benchmarks/import_time.py --runs 20
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "lazy": "import payments_service.views",
+    "eager": (
+        "import payments_service.views\n"
+        "from payments_service import service\n"
+        "service.adapter_factories.resolve_all()"
+    ),
+}
+
+
+def time_import(code):
+    """Wall time of a fresh interpreter running ``code``, in milliseconds."""
+    started = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", code],
+        cwd=ROOT,
+        check=True,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    return (time.perf_counter() - started) * 1000
+
+
+def slowest_imports(code, limit):
+    """The ``limit`` packages with the largest cumulative import time, from
+    ``python -X importtime``."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT,
+        check=True,
+        capture_output=True,
+        text=True,
+    )
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or line.count("|") != 2:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        name = name.strip()
+        if not cumulative.strip().isdigit() or "." in name:
+            continue
+        packages[name] = max(packages.get(name, 0), int(cumulative) / 1000)
+    return sorted(
+        ((cumulative, name) for name, cumulative in packages.items()), reverse=True
+    )[:limit]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument(
+        "--top", type=int, default=10, help="slowest imports to list per scenario"
+    )
+    args = parser.parse_args(argv)
+
+    results = {}
+    for name, code in SCENARIOS.items():
+        time_import(code)  # warm the bytecode cache
+        results[name] = sorted(time_import(code) for _ in range(args.runs))
+
+    print(f"{'scenario':<10} {'runs':>5} {'median ms':>10} {'min ms':>9} {'max ms':>9}")
+    for name, timings in results.items():
+        print(
+            f"{name:<10} {len(timings):>5} {statistics.median(timings):>10.1f} "
+            f"{timings[0]:>9.1f} {timings[-1]:>9.1f}"
+        )
+    saved = statistics.median(results["eager"]) - statistics.median(results["lazy"])
+    print(f"\nlazy provider imports save {saved:.1f} ms per cold start")
+
+    for name, code in SCENARIOS.items():
+        print(f"\nslowest packages to import ({name}):")
+        for cumulative, module in slowest_imports(code, args.top):
+            print(f"  {cumulative:>8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""Drive payments_service under concurrent load against the local stubs.
+
+Starts ``benchmarks.stubs:app`` and ``payments_service.views:app`` with
+uvicorn, points the service at the stubs, then runs every scenario and prints
+throughput and p50/p95/p99 latency per route.
+
+    python benchmarks/run.py --concurrency 50 --requests 2000 --latency 0.05
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AMOUNT = 4000
+
+
+def unique(prefix):
+    return f"{prefix}{uuid.uuid4().hex[:12]}"
+
+
+def flutterwave_webhook():
+    body = {
+        "event": "charge.completed",
+        "data": {
+            "id": unique(""),
+            "tx_ref": unique("BENCH"),
+            "amount": AMOUNT,
+            "currency": "NGN",
+            "status": "successful",
+            "customer": {"email": "bench@example.com"},
+        },
+    }
+    return {"json": body, "headers": {"verif-hash": "bench_flutterwave"}}
+
+
+def build_payment_info():
+    return {
+        "json": {
+            "amount": AMOUNT,
+            "currency": "NGN",
+            "order": unique("ORDER"),
+            "user": {"email": "bench@example.com"},
+            "return_url": "http://localhost/return",
+        }
+    }
+
+
+def verify_params():
+    return {
+        "params": {"amount": AMOUNT, "txref": unique("BENCH"), "amount_only": "true"}
+    }
+
+
+def batch_verify():
+    return {
+        "json": {
+            "payments": [
+                {"txref": unique("BENCH"), "amount": AMOUNT} for _ in range(20)
+            ],
+            "amount_only": True,
+        }
+    }
+
+
+# name -> (method, path, builder for the request keyword arguments)
+#
+# /generate-account-no/{identifier} is not driven: the provider endpoint it
+# calls comes from the pypaystack/pyravepay ``create_payment_account``
+# implementations, which the stubs do not reproduce.
+SCENARIOS = {
+    "home": ("GET", "/", dict),
+    "verify-payment/paystack": (
+        "GET",
+        "/verify-payment/bench_paystack",
+        verify_params,
+    ),
+    "verify-payment/flutterwave": (
+        "GET",
+        "/verify-payment/bench_flutterwave",
+        verify_params,
+    ),
+    "verify-payment/stripe": (
+        "GET",
+        "/verify-payment/bench_stripe",
+        lambda: {"params": {"amount": AMOUNT, "txref": unique("cs_test_")}},
+    ),
+    "verify-payments/flutterwave": (
+        "POST",
+        "/verify-payments/bench_flutterwave",
+        batch_verify,
+    ),
+    "build-payment-info/flutterwave": (
+        "POST",
+        "/build-payment-info/bench_flutterwave",
+        build_payment_info,
+    ),
+    "build-payment-info/stripe": (
+        "POST",
+        "/build-payment-info/bench_stripe",
+        build_payment_info,
+    ),
+    "webhook/flutterwave": ("POST", "/webhook", flutterwave_webhook),
+}
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, int(round(fraction * len(values))) - 1))
+    return values[index]
+
+
+def run_scenario(base_url, method, path, build, total, concurrency):
+    local = threading.local()
+    latencies = []
+    errors = []
+
+    def one(_):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        kwargs = build()
+        started = time.perf_counter()
+        try:
+            response = session.request(method, base_url + path, timeout=60, **kwargs)
+            failed = (
+                response.status_code >= 400 or response.json().get("status") is False
+            )
+        except Exception:
+            failed = True
+        elapsed = time.perf_counter() - started
+        latencies.append(elapsed)
+        if failed:
+            errors.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": len(errors),
+        "throughput": total / wall,
+        "p50": percentile(latencies, 0.50) * 1000,
+        "p95": percentile(latencies, 0.95) * 1000,
+        "p99": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def start_server(app, port, env):
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            app,
+            "--port",
+            str(port),
+            "--log-level",
+            "warning",
+            "--no-access-log",
+        ],
+        cwd=ROOT,
+        env={**os.environ, **env},
+    )
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            requests.get(url, timeout=1)
+            return
+        except requests.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not start within {timeout}s")
+
+
+def print_report(results):
+    header = f"{'route':<32} {'reqs':>6} {'errors':>6} {'req/s':>9} "
+    header += f"{'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, result in results.items():
+        print(
+            f"{name:<32} {result['requests']:>6} {result['errors']:>6} "
+            f"{result['throughput']:>9.1f} {result['p50']:>9.1f} "
+            f"{result['p95']:>9.1f} {result['p99']:>9.1f}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument(
+        "--latency", type=float, default=0.05, help="stub latency in seconds"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="stub failure probability"
+    )
+    parser.add_argument("--app-port", type=int, default=8100)
+    parser.add_argument("--stub-port", type=int, default=8101)
+    parser.add_argument(
+        "--scenario",
+        action="append",
+        choices=sorted(SCENARIOS),
+        help="run only these scenarios (repeatable)",
+    )
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+    app_url = f"http://127.0.0.1:{args.app_port}"
+    workdir = tempfile.mkdtemp(prefix="now-payments-bench-")
+    stub_env = {
+        "BENCH_LATENCY": str(args.latency),
+        "BENCH_ERROR_RATE": str(args.error_rate),
+    }
+    app_env = {
+        "NOW_SHEET_SERVICE": f"{stub_url}/sheet",
+        "PAYMENT_SHEET": "bench",
+        "HOST_URL": app_url,
+        "PAYSTACK_BASE_URL": f"{stub_url}/paystack",
+        "FLUTTERWAVE_BASE_URL": f"{stub_url}/flutterwave",
+        "STRIPE_API_BASE": f"{stub_url}/stripe",
+        "OUTBOX_PATH": os.path.join(workdir, "outbox.sqlite3"),
+        "HTTP_DNS_CACHE_TTL": "0",
+    }
+    servers = [
+        start_server("benchmarks.stubs:app", args.stub_port, stub_env),
+        start_server("payments_service.views:app", args.app_port, app_env),
+    ]
+    try:
+        wait_until_up(stub_url)
+        wait_until_up(app_url)
+        results = {}
+        for name in args.scenario or SCENARIOS:
+            method, path, build = SCENARIOS[name]
+            # Warm up connection pools and the credential cache.
+            run_scenario(app_url, method, path, build, args.concurrency, 1)
+            results[name] = run_scenario(
+                app_url, method, path, build, args.requests, args.concurrency
+            )
+        print_report(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+    finally:
+        for server in servers:
+            server.terminate()
+        for server in servers:
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
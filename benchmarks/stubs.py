@@ -0,0 +1,174 @@
+"""Local stand-ins for the services payments_service talks to.
+
+One Starlette app serves the sheet service under ``/sheet``, the Flutterwave
+v3 API under ``/flutterwave``, Paystack under ``/paystack``, Stripe under
+``/stripe`` and a merchant webhook receiver under ``/merchant``. Every stub
+waits ``BENCH_LATENCY`` seconds and fails with ``BENCH_ERROR_RATE``
+probability; both can be set per stub, e.g. ``BENCH_STRIPE_LATENCY``.
+
+    uvicorn benchmarks.stubs:app --port 8101
+"""
+
+import asyncio
+import os
+import random
+import uuid
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Mount, Route
+
+TENANTS = {
+    "bench_paystack": {"type": "paystack"},
+    "bench_flutterwave": {"type": "flutterwave"},
+    "bench_stripe": {"type": "stripe"},
+}
+AMOUNT = 4000
+
+
+def stub_config(name):
+    latency = os.environ.get(f"BENCH_{name.upper()}_LATENCY")
+    error_rate = os.environ.get(f"BENCH_{name.upper()}_ERROR_RATE")
+    if latency is None:
+        latency = os.environ.get("BENCH_LATENCY", "0.05")
+    if error_rate is None:
+        error_rate = os.environ.get("BENCH_ERROR_RATE", "0")
+    return float(latency), float(error_rate)
+
+
+def stub(name):
+    """Wrap an endpoint with the configured latency and error rate."""
+    latency, error_rate = stub_config(name)
+
+    def decorator(endpoint):
+        async def wrapper(request):
+            if latency:
+                await asyncio.sleep(random.uniform(0.5, 1.5) * latency)
+            if random.random() < error_rate:
+                return JSONResponse(
+                    {"status": "error", "message": "stub failure"}, status_code=500
+                )
+            return await endpoint(request)
+
+        return wrapper
+
+    return decorator
+
+
+def tenant_row(request, identifier):
+    base = str(request.base_url).rstrip("/")
+    return {
+        "id": identifier,
+        "public_key": f"pk_test_{identifier}",
+        "secret_key": f"sk_test_{identifier}",
+        "test": "TRUE",
+        "webhook_url": f"{base}/merchant/hook",
+        **TENANTS[identifier],
+    }
+
+
+@stub("sheet")
+async def read_single(request):
+    body = await request.json()
+    identifier = body.get("value")
+    if identifier not in TENANTS:
+        return JSONResponse({"data": None})
+    return JSONResponse({"data": tenant_row(request, identifier)})
+
+
+@stub("sheet")
+async def read_all(request):
+    return JSONResponse(
+        {"data": [tenant_row(request, identifier) for identifier in TENANTS]}
+    )
+
+
+@stub("flutterwave")
+async def flutterwave_verify(request):
+    reference = request.path_params["reference"]
+    return JSONResponse(
+        {
+            "status": "success",
+            "message": "Transaction fetched successfully",
+            "data": {
+                "id": reference,
+                "tx_ref": reference,
+                "amount": AMOUNT,
+                "currency": "NGN",
+                "status": "successful",
+                "customer": {"email": "bench@example.com"},
+            },
+        }
+    )
+
+
+@stub("paystack")
+async def paystack_verify(request):
+    reference = request.path_params["reference"]
+    return JSONResponse(
+        {
+            "status": True,
+            "message": "Verification successful",
+            "data": {
+                "reference": reference,
+                "amount": AMOUNT,
+                "currency": "NGN",
+                "status": "success",
+            },
+        }
+    )
+
+
+def checkout_session(session_id, status="open"):
+    return {
+        "id": session_id,
+        "object": "checkout.session",
+        "client_secret": f"{session_id}_secret",
+        "customer": None,
+        "mode": "payment",
+        "status": status,
+        "subscription": None,
+        "url": None,
+    }
+
+
+@stub("stripe")
+async def stripe_create_session(request):
+    return JSONResponse(checkout_session(f"cs_test_{uuid.uuid4().hex}"))
+
+
+@stub("stripe")
+async def stripe_retrieve_session(request):
+    return JSONResponse(
+        checkout_session(request.path_params["session_id"], status="complete")
+    )
+
+
+@stub("merchant")
+async def merchant_hook(request):
+    await request.body()
+    return JSONResponse({"status": "Success"})
+
+
+app = Starlette(
+    routes=[
+        Route("/sheet/read-single", read_single, methods=["POST"]),
+        Route("/sheet/read", read_all, methods=["POST"]),
+        Mount(
+            "/flutterwave",
+            routes=[Route("/transactions/{reference}/verify", flutterwave_verify)],
+        ),
+        Mount(
+            "/paystack",
+            routes=[Route("/transaction/verify/{reference}", paystack_verify)],
+        ),
+        Mount(
+            "/stripe",
+            routes=[
+                Route("/v1/checkout/sessions", stripe_create_session, methods=["POST"]),
+                Route("/v1/checkout/sessions/{session_id}", stripe_retrieve_session),
+            ],
+        ),
+        Route("/merchant/hook", merchant_hook, methods=["POST"]),
+    ]
+)
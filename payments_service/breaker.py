@@ -0,0 +1,165 @@
+import collections
+import threading
+import time
+import typing
+
+from payments_service import log
+from payments_service import metrics
+from payments_service import settings
+
+logger = log.get_logger(__name__)
+
+circuit_opened = metrics.registry.counter(
+    "payments_circuit_opened_total",
+    "Times the circuit breaker for an upstream host opened.",
+    ("host",),
+)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a host whose circuit breaker is open."""
+
+    def __init__(self, host: str, retry_after: float):
+        super().__init__(f"{host} is unavailable, retry in {retry_after:.0f}s")
+        self.host = host
+        self.retry_after = retry_after
+
+
+class HostHealth:
+    """Error rate and latency of the calls made to one upstream host.
+
+    The circuit opens when at least ``failure_ratio`` of the calls in the last
+    ``window`` seconds failed (and there were at least ``min_calls``), and
+    stays open for ``open_for`` seconds. After that a single probe call is let
+    through; it closes the circuit again if it succeeds.
+
+    Read timeouts are derived from the p99 latency of recent successful calls
+    so a degraded host fails fast instead of holding workers for the full
+    configured timeout."""
+
+    def __init__(
+        self,
+        host: str,
+        window: float = 30.0,
+        min_calls: int = 20,
+        failure_ratio: float = 0.5,
+        open_for: float = 15.0,
+        timer=time.monotonic,
+    ):
+        self.host = host
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.open_for = open_for
+        self.timer = timer
+        self.latencies: typing.Deque[float] = collections.deque(maxlen=200)
+        self._outcomes: typing.Deque[typing.Tuple[float, bool]] = collections.deque()
+        self._failures = 0
+        self._opened_until: typing.Optional[float] = None
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_until is not None
+
+    def check(self) -> bool:
+        """Raise ``CircuitOpenError`` if calls to this host should not be
+        attempted right now. Returns whether the call is the probe that
+        decides if the circuit closes again."""
+        if self._opened_until is None:
+            return False
+        with self._lock:
+            if self._opened_until is None:
+                return False
+            remaining = self._opened_until - self.timer()
+            if remaining > 0 or self._probing:
+                raise CircuitOpenError(self.host, max(remaining, 1))
+            self._probing = True
+            return True
+
+    def release_probe(self):
+        """Let the next call probe the host after the probe was cancelled
+        without an answer."""
+        with self._lock:
+            self._probing = False
+
+    def record(self, failed: bool, latency: float):
+        now = self.timer()
+        with self._lock:
+            if not failed:
+                self.latencies.append(latency)
+            if self._probing:
+                self._probing = False
+                if failed:
+                    self._opened_until = now + self.open_for
+                else:
+                    self._opened_until = None
+                    self._outcomes.clear()
+                    self._failures = 0
+                return
+            self._outcomes.append((now, failed))
+            self._failures += failed
+            while self._outcomes and self._outcomes[0][0] < now - self.window:
+                self._failures -= self._outcomes.popleft()[1]
+            calls = len(self._outcomes)
+            if (
+                self._opened_until is None
+                and calls >= self.min_calls
+                and self._failures >= self.failure_ratio * calls
+            ):
+                self._opened_until = now + self.open_for
+                self._outcomes.clear()
+                self._failures = 0
+                circuit_opened.inc(host=self.host)
+                logger.warning(
+                    "circuit opened",
+                    extra={"host": self.host, "open_for": self.open_for},
+                )
+
+    def percentile(self, fraction: float) -> typing.Optional[float]:
+        """Latency percentile of recent successful calls, or ``None`` until
+        there are enough of them."""
+        latencies = sorted(self.latencies)
+        if len(latencies) < 20:
+            return None
+        return latencies[int(fraction * (len(latencies) - 1))]
+
+    def read_timeout(self, default: float) -> float:
+        """``default`` capped at a multiple of the recent p99 latency."""
+        p99 = self.percentile(0.99)
+        if p99 is None:
+            return default
+        adaptive = max(
+            settings.HTTP_MIN_READ_TIMEOUT, p99 * settings.HTTP_TIMEOUT_MULTIPLIER
+        )
+        return min(default, adaptive)
+
+    def timeout(self, timeout):
+        """Apply the adaptive read timeout to a requests-style timeout."""
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            return (connect, self.read_timeout(read))
+        if timeout is None:
+            return timeout
+        return self.read_timeout(timeout)
+
+
+_hosts: typing.Dict[str, HostHealth] = {}
+_hosts_lock = threading.Lock()
+
+
+def host_health(host: str) -> HostHealth:
+    health = _hosts.get(host)
+    if health is None:
+        with _hosts_lock:
+            health = _hosts.get(host)
+            if health is None:
+                health = _hosts[host] = HostHealth(
+                    host,
+                    window=settings.CIRCUIT_WINDOW,
+                    min_calls=settings.CIRCUIT_MIN_CALLS,
+                    failure_ratio=settings.CIRCUIT_FAILURE_RATIO,
+                    open_for=settings.CIRCUIT_OPEN_FOR,
+                )
+    return health
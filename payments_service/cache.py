@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+import typing
+from collections import OrderedDict
+
+_MISSING = object()
+
+
+class TTLCache:
+    """Bounded in-memory mapping whose entries expire ``ttl`` seconds after
+    being stored. When ``maxsize`` is reached the least recently used entry is
+    evicted first. Safe to use from several threads."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data: "OrderedDict[typing.Hashable, typing.Tuple[float, typing.Any]]" = (
+            OrderedDict()
+        )
+        self._pending: typing.Dict[typing.Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires, value = item
+            if expires <= self.timer():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl: typing.Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        with self._lock:
+            self._data[key] = (self.timer() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            item = self._data.pop(key, None)
+        if item is None:
+            return default
+        return item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    async def get_or_fetch(
+        self,
+        key,
+        fetch: typing.Callable[[], typing.Awaitable[typing.Any]],
+        cache_if: typing.Optional[typing.Callable[[typing.Any], bool]] = None,
+    ):
+        """Return the cached value for ``key`` or call ``fetch`` to load it.
+
+        Concurrent misses for the same key share a single call to ``fetch``.
+        ``None`` results are never stored, and ``cache_if`` can be used to
+        restrict further which results are worth keeping."""
+        value = self.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fill(key, fetch, cache_if))
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fill(self, key, fetch, cache_if):
+        value = await fetch()
+        if value is not None and (cache_if is None or cache_if(value)):
+            self.set(key, value)
+        return value
@@ -0,0 +1,476 @@
+"""Where tenant credentials are read from.
+
+``SheetBackend`` reads rows from the payment sheet through the sheet
+service. ``SQLiteBackend`` keeps a local copy indexed by ``id`` so lookups
+never leave the process; fill it from the sheet with::
+
+    python -m payments_service.credentials import-sheet
+
+``SnapshotBackend`` holds the whole sheet in memory and refreshes it in the
+background. ``SharedSnapshotBackend`` does the same through a file that every
+worker on the host reads, so only one of them refreshes it from the sheet.
+Make every worker refresh now with::
+
+    python -m payments_service.credentials invalidate
+"""
+
+import argparse
+import asyncio
+import fcntl
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import typing
+
+from payments_service import fastjson
+from payments_service import files
+from payments_service import log
+from payments_service import metrics
+from payments_service import settings
+from payments_service import transport
+
+logger = log.get_logger(__name__)
+
+Row = typing.Mapping[str, typing.Any]
+
+
+class CredentialBackend:
+    """Source of payment sheet rows keyed by tenant ``id``.
+
+    ``local`` backends answer from memory or local disk, fast enough to be
+    called directly on the event loop; other backends are run on the
+    executor."""
+
+    name = "base"
+    local = False
+    # Consulted when this backend does not know an identifier.
+    fallback: typing.Optional["CredentialBackend"] = None
+
+    def get(self, identifier: str) -> typing.Optional[Row]:
+        raise NotImplementedError
+
+    def all(self) -> typing.List[Row]:
+        raise NotImplementedError
+
+    def knows(self, identifier: str) -> typing.Optional[bool]:
+        """Whether ``identifier`` is a tenant, answered without a remote call,
+        or ``None`` when this backend cannot tell without looking it up."""
+        return None
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+
+class SheetBackend(CredentialBackend):
+    name = "sheet"
+
+    def __init__(self, service_url: str, sheet: str, worksheet: str = "Sheet1"):
+        self.service_url = service_url
+        self.sheet = sheet
+        self.worksheet = worksheet
+
+    def get(self, identifier):
+        result = transport.request(
+            "POST",
+            self.service_url + "/read-single",
+            json={
+                "link": self.sheet,
+                "key": "id",
+                "sheet": self.worksheet,
+                "value": identifier,
+            },
+        )
+        data = None
+        if result.status_code < 400:
+            data = result.json()["data"]
+        logger.debug(
+            "sheet lookup",
+            extra={
+                "identifier": identifier,
+                "status_code": result.status_code,
+                "data": data,
+            },
+        )
+        # Only an answer without data means the tenant does not exist; an
+        # unavailable sheet must not be remembered as one.
+        result.raise_for_status()
+        return data or None
+
+    def all(self):
+        result = transport.request(
+            "POST",
+            self.service_url + "/read",
+            json={"link": self.sheet, "sheet": self.worksheet},
+        )
+        result.raise_for_status()
+        return [row for row in result.json()["data"] if row.get("id")]
+
+
+class SQLiteBackend(CredentialBackend):
+    name = "sqlite"
+    local = True
+
+    def __init__(self, path: str):
+        self.path = os.path.expanduser(path)
+        self._db: typing.Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    db = sqlite3.connect(
+                        files.private_file(self.path),
+                        check_same_thread=False,
+                        isolation_level=None,
+                    )
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.execute(
+                        "CREATE TABLE IF NOT EXISTS tenants "
+                        "(id TEXT PRIMARY KEY, row TEXT NOT NULL)"
+                    )
+                    self._db = db
+        return self._db
+
+    def get(self, identifier):
+        db = self.db
+        with self._lock:
+            found = db.execute(
+                "SELECT row FROM tenants WHERE id = ?", (identifier,)
+            ).fetchone()
+        if found is None:
+            return None
+        return json.loads(found[0])
+
+    def all(self):
+        db = self.db
+        with self._lock:
+            rows = db.execute("SELECT row FROM tenants ORDER BY id").fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def knows(self, identifier):
+        db = self.db
+        with self._lock:
+            found = db.execute(
+                "SELECT 1 FROM tenants WHERE id = ?", (identifier,)
+            ).fetchone()
+        return found is not None
+
+    def replace_all(self, rows: typing.Iterable[Row]) -> int:
+        """Atomically replace the stored rows. Returns how many were stored."""
+        values = [(row["id"], json.dumps(dict(row))) for row in rows]
+        db = self.db
+        with self._lock:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM tenants")
+                db.executemany("INSERT INTO tenants (id, row) VALUES (?, ?)", values)
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        return len(values)
+
+
+class SnapshotBackend(CredentialBackend):
+    """In-memory index of every row of ``source``, loaded in bulk at startup
+    and refreshed in the background every ``interval`` seconds.
+
+    A failed refresh keeps the last good snapshot, so lookups keep working
+    while the source is slow or down. Identifiers missing from the snapshot
+    are looked up in ``source`` directly."""
+
+    name = "snapshot"
+    local = True
+
+    def __init__(self, source: CredentialBackend, interval: float = 300.0):
+        self.source = source
+        self.fallback = source
+        self.interval = interval
+        self.rows: typing.Dict[str, Row] = {}
+        self.loaded_at: typing.Optional[float] = None
+        self._task: typing.Optional[asyncio.Task] = None
+
+    def get(self, identifier):
+        return self.rows.get(identifier)
+
+    def all(self):
+        return list(self.rows.values())
+
+    def knows(self, identifier):
+        # Tenants added since the last refresh are unknown until the next one.
+        if self.loaded_at is None:
+            return None
+        return identifier in self.rows
+
+    def refresh(self) -> int:
+        rows = {row["id"]: row for row in self.source.all()}
+        # Swapped in one assignment; readers see the old or the new index.
+        self.rows = rows
+        self.loaded_at = time.time()
+        return len(rows)
+
+    def age(self) -> float:
+        if self.loaded_at is None:
+            return float("inf")
+        return time.time() - self.loaded_at
+
+    async def _refresh(self):
+        loop = asyncio.get_event_loop()
+        try:
+            count = await loop.run_in_executor(None, self.refresh)
+        except Exception:
+            logger.warning(
+                "credential refresh failed, serving last snapshot",
+                exc_info=True,
+                extra={"age": self.age()},
+            )
+        else:
+            logger.info("credential snapshot loaded", extra={"tenants": count})
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self._refresh()
+
+    async def start(self):
+        await self._refresh()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+class SharedSnapshotBackend(SnapshotBackend):
+    """``SnapshotBackend`` whose snapshot is a file shared by every worker on
+    the host. Kept under ``/tmp`` it also survives serverless warm starts.
+
+    Each worker answers lookups from its own in-memory copy and reloads it
+    every ``poll`` seconds if the file was replaced. A stale file is only
+    refreshed from ``source`` by the worker holding an exclusive ``flock`` on
+    ``<path>.d/lock``; it writes the new snapshot next to the old one and
+    renames it into place, so N workers make one upstream request per
+    refresh instead of N. ``invalidate`` marks the snapshot stale for every
+    worker. ``<path>.d`` is only accessible to the user the workers run
+    as."""
+
+    name = "shared"
+
+    def __init__(
+        self,
+        source: CredentialBackend,
+        path: str,
+        interval: float = 300.0,
+        poll: float = 5.0,
+    ):
+        super().__init__(source, interval)
+        self.path = path
+        self.poll = poll
+        # (inode, mtime, size) of the file the in-memory copy was read from.
+        self._file: typing.Optional[tuple] = None
+        self._retry_at = 0.0
+        self._state_dir: typing.Optional[str] = None
+
+    @property
+    def state_dir(self) -> str:
+        if self._state_dir is None:
+            self._state_dir = files.private_dir(self.path + ".d")
+        return self._state_dir
+
+    @property
+    def invalidation_path(self) -> str:
+        return os.path.join(self.state_dir, "invalidated")
+
+    def invalidate(self):
+        """Make the next sync of every worker refresh from ``source``."""
+        with open(self.invalidation_path, "w") as f:
+            f.write(str(time.time()))
+
+    def stale(self) -> bool:
+        if self.age() >= self.interval:
+            return True
+        try:
+            invalidated = os.stat(self.invalidation_path).st_mtime
+        except FileNotFoundError:
+            return False
+        return invalidated > self.loaded_at
+
+    def load(self) -> bool:
+        """Reload the file if it was replaced. Returns whether it was."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        with f:
+            stat = os.fstat(f.fileno())
+            signature = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            if signature == self._file:
+                return False
+            try:
+                if stat.st_uid != os.getuid():
+                    raise ValueError("owned by another user")
+                snapshot = fastjson.loads(f.read())
+                rows = {row["id"]: row for row in snapshot["rows"]}
+                loaded_at = float(snapshot["loaded_at"])
+            except (ValueError, KeyError, TypeError):
+                logger.warning(
+                    "unreadable credential snapshot", extra={"path": self.path}
+                )
+                return False
+        self.rows = rows
+        self.loaded_at = loaded_at
+        self._file = signature
+        return True
+
+    def write(self, rows: typing.List[Row]):
+        """Atomically replace the file with ``rows``."""
+        fd, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(self.path) or ".", prefix=".credentials-"
+        )
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(fastjson.dumps({"loaded_at": time.time(), "rows": rows}))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def sync(self, wait: bool = False) -> bool:
+        """Pick up the file another worker wrote and refresh it from
+        ``source`` if it is stale. Unless ``wait`` is set, a worker that finds
+        another one refreshing leaves it to them. Returns whether the
+        in-memory copy changed."""
+        changed = self.load()
+        if not self.stale() or time.monotonic() < self._retry_at:
+            return changed
+        with open(os.path.join(self.state_dir, "lock"), "a") as lock:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | (0 if wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                return changed
+            try:
+                # Another worker may have refreshed it in the meantime.
+                changed = self.load() or changed
+                if not self.stale():
+                    return changed
+                try:
+                    rows = self.source.all()
+                except Exception:
+                    self._retry_at = time.monotonic() + min(self.interval, 60)
+                    raise
+                self.write(rows)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+        return self.load()
+
+    def refresh(self):
+        self.sync(wait=True)
+        return len(self.rows)
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(self.poll)
+            try:
+                changed = await loop.run_in_executor(None, self.sync)
+            except Exception:
+                logger.warning(
+                    "credential refresh failed, serving last snapshot",
+                    exc_info=True,
+                    extra={"age": self.age()},
+                )
+            else:
+                if changed:
+                    logger.info(
+                        "credential snapshot loaded", extra={"tenants": len(self.rows)}
+                    )
+
+
+def import_rows(source: CredentialBackend, target: SQLiteBackend) -> int:
+    return target.replace_all(source.all())
+
+
+def sheet_backend() -> SheetBackend:
+    return SheetBackend(settings.NOW_SHEET_SERVICE, settings.PAYMENT_SHEET)
+
+
+def sqlite_backend() -> SQLiteBackend:
+    return SQLiteBackend(settings.CREDENTIAL_DB_PATH)
+
+
+def _watch_age(backend: SnapshotBackend) -> SnapshotBackend:
+    metrics.registry.gauge(
+        "payments_credential_snapshot_age_seconds",
+        "Seconds since the credential snapshot was last refreshed.",
+        backend.age,
+    )
+    return backend
+
+
+def snapshot_backend() -> SnapshotBackend:
+    return _watch_age(
+        SnapshotBackend(sheet_backend(), settings.CREDENTIAL_REFRESH_INTERVAL)
+    )
+
+
+def shared_backend() -> SharedSnapshotBackend:
+    return _watch_age(
+        SharedSnapshotBackend(
+            sheet_backend(),
+            settings.CREDENTIAL_SNAPSHOT_PATH,
+            interval=settings.CREDENTIAL_REFRESH_INTERVAL,
+            poll=settings.CREDENTIAL_SNAPSHOT_POLL,
+        )
+    )
+
+
+backends = {
+    "sheet": sheet_backend,
+    "sqlite": sqlite_backend,
+    "snapshot": snapshot_backend,
+    "shared": shared_backend,
+}
+
+
+def get_backend(name: typing.Optional[str] = None) -> CredentialBackend:
+    return backends[name or settings.CREDENTIAL_BACKEND]()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m payments_service.credentials")
+    commands = parser.add_subparsers(dest="command", required=True)
+    command = commands.add_parser(
+        "import-sheet", help="copy every row of the payment sheet into SQLite"
+    )
+    command.add_argument("--path", default=settings.CREDENTIAL_DB_PATH)
+    command = commands.add_parser(
+        "invalidate", help="make every worker refresh the shared snapshot now"
+    )
+    command.add_argument("--path", default=settings.CREDENTIAL_SNAPSHOT_PATH)
+    args = parser.parse_args(argv)
+    if args.command == "import-sheet":
+        count = import_rows(sheet_backend(), SQLiteBackend(args.path))
+        print(f"imported {count} tenants into {args.path}")
+    elif args.command == "invalidate":
+        SharedSnapshotBackend(sheet_backend(), args.path).invalidate()
+        print(f"invalidated {args.path}")
+
+
+if __name__ == "__main__":
+    main()
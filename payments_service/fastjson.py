@@ -0,0 +1,39 @@
+"""JSON encoding and decoding through orjson when it is installed
+(``pip install orjson``), falling back to the standard library."""
+
+import json
+import typing
+
+from starlette.requests import Request
+from starlette.responses import JSONResponse as BaseJSONResponse
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - depends on the environment
+    orjson = None
+
+
+def loads(data: typing.Union[bytes, str]) -> typing.Any:
+    """Parse ``data``. Raises ``ValueError`` if it is not valid JSON."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value: typing.Any) -> bytes:
+    """Compact UTF-8 encoded JSON, as Starlette's ``JSONResponse`` renders."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(
+        value, ensure_ascii=False, allow_nan=False, separators=(",", ":")
+    ).encode("utf-8")
+
+
+async def read_json(request: Request) -> typing.Any:
+    """The request body, parsed."""
+    return loads(await request.body())
+
+
+class JSONResponse(BaseJSONResponse):
+    def render(self, content: typing.Any) -> bytes:
+        return dumps(content)
@@ -0,0 +1,35 @@
+"""Local files that hold tenant secrets or merchant data and must only be
+readable by the user the service runs as."""
+
+import os
+import stat
+
+
+def private_file(path: str) -> str:
+    """Create ``path`` with mode 0600 if it does not exist, tighten it if it
+    does, and refuse a file owned by another user. Missing parent directories
+    are created with mode 0700. SQLite gives its journal files the same mode
+    as the database."""
+    parent = os.path.dirname(path)
+    if parent:
+        os.makedirs(parent, 0o700, exist_ok=True)
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        if os.fstat(fd).st_uid != os.getuid():
+            raise PermissionError(f"{path} is owned by another user")
+        os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+    return path
+
+
+def private_dir(path: str) -> str:
+    """Create directory ``path`` with mode 0700 if it does not exist, tighten
+    it if it does, and refuse a symlink or a directory owned by another
+    user."""
+    os.makedirs(path, 0o700, exist_ok=True)
+    found = os.lstat(path)
+    if not stat.S_ISDIR(found.st_mode) or found.st_uid != os.getuid():
+        raise PermissionError(f"{path} is not a directory owned by this user")
+    os.chmod(path, 0o700)
+    return path
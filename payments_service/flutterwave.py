@@ -1,10 +1,13 @@
-import requests
 import logging
-import json
 
 from ravepay.api.base import BaseClass
 from ravepay.api.webhook import Webhook as RavepayWebhook
 from ravepay.api import signals
+from payments_service import fastjson
+from payments_service import settings
+from payments_service import transport
+from payments_service import webhook_signals  # noqa: F401 connects receivers
+from payments_service.tenants import TenantRecord
 
 
 def charge_data(raw_data, full_auth=False, full=False):
@@ -43,10 +46,12 @@ class Webhook(RavepayWebhook):
         use_default=False,
         full_auth=False,
         full=False,
+        payload=None,
         **kwargs,
     ):
         if unique_code == self.webhook_has:
-            payload = json.loads(request_body)
+            if payload is None:
+                payload = fastjson.loads(request_body)
             if payload["event"] in ["charge.completed"]:
                 kwargs["data"] = charge_data(
                     payload["data"], full_auth=full_auth, full=full
@@ -72,6 +77,9 @@ class Webhook(RavepayWebhook):
 
 
 class Transaction(BaseClass):
+    def __init__(self, make_request, async_make_request=None, **kwargs):
+        super().__init__(make_request, **kwargs)
+        self.async_make_request = async_make_request
 
     def verify_result(self, response, **kwargs):
         if response.status_code == 200:
@@ -80,7 +88,7 @@ class Transaction(BaseClass):
             amount = kwargs.get("amount")
             if amount:
                 if float(data["amount"]) == float(float(amount)):
-                    return True, result["message"]
+                    return True, result["message"], data
                 return False, data["amount"]
             return True, result["message"], data
 
@@ -89,13 +97,21 @@ class Transaction(BaseClass):
 
     def verify_payment(self, code, amount_only=True, **kwargs):
         path = "/transactions/{}/verify".format(code)
-        response = self.make_request("GET", path)
+        response = self.make_request("GET", path, hedge=True)
         
         if amount_only:
             return self.verify_result(response, **kwargs)
         # add test for this scenario
         return self.result_format(response)
 
+    async def async_verify_payment(self, code, amount_only=True, **kwargs):
+        path = "/transactions/{}/verify".format(code)
+        response = await self.async_make_request("GET", path, hedge=True)
+
+        if amount_only:
+            return self.verify_result(response, **kwargs)
+        return self.result_format(response)
+
     def build_transaction_obj(self, currency="ngn", **kwargs):
         payment_options = {
             'ngn': 'card, banktransfer, account',
@@ -140,7 +156,7 @@ class Transaction(BaseClass):
         return json_data
 
 
-class FlutterwaveAPI:
+class FlutterwaveAPI(transport.AsyncAdapterMixin):
     base_url = ""
 
     def __init__(self, django=True, **kwargs):
@@ -148,7 +164,10 @@ class FlutterwaveAPI:
         for key, value in kwargs.items():
             setattr(self, key, value)
         self.transaction_api = Transaction(
-            self.make_request, secret_key=self.secret_key, public_key=self.public_key
+            self.make_request,
+            async_make_request=self.async_make_request,
+            secret_key=self.secret_key,
+            public_key=self.public_key,
         )
         # self.transfer_api = api.Transfer(
         #     self.make_request, secret_key=self.secret_key, public_key=self.public_key
@@ -156,39 +175,44 @@ class FlutterwaveAPI:
         self.webhook_api = Webhook(self.secret_key, self.webhook_hash)
 
     def make_request(self, method, path, **kwargs):
-        options = {
-            "GET": requests.get,
-            "POST": requests.post,
-            "PUT": requests.put,
-            "DELETE": requests.delete,
-        }
         url = "{}{}".format(self.base_url, path)
         headers = {
             "Content-Type": "application/json",
             "Authorization": "Bearer {}".format(self.secret_key),
         }
-        return options[method](url, headers=headers, **kwargs)
+        return transport.request(method, url, headers=headers, **kwargs)
 
-    async def async_make_request(self, method, path, session, **kwargs):
+    async def async_make_request(self, method, path, session=None, **kwargs):
+        url = "{}{}".format(self.base_url, path)
+        headers = {
+            "Authorization": "Bearer {}".format(self.secret_key),
+            "Content-Type": "application/json",
+        }
+        if session is None:
+            return await transport.async_request(method, url, headers=headers, **kwargs)
+        kwargs.pop("hedge", None)
         options = {
             "GET": session.get,
             "POST": session.post,
             "PUT": session.put,
             "DELETE": session.delete,
         }
-        url = "{}{}".format(self.base_url, path)
-        headers = {
-            "Authorization": "Bearer {}".format(self.secret_key),
-            "Content-Type": "application/json",
-        }
         return await options[method](url, headers=headers, **kwargs)
 
     def verify_result(self, response, **kwargs):
         return self.transaction_api.verify_result(response, **kwargs)
 
+    async def async_verify_webhook(self, signature, body, payload, **kwargs):
+        return await transport.run_sync(
+            self.webhook_api.verify, signature, body, payload=payload, **kwargs
+        )
+
     def verify_payment(self, code, **kwargs):
         return self.transaction_api.verify_payment(code, **kwargs)
 
+    async def async_verify_payment(self, code, **kwargs):
+        return await self.transaction_api.async_verify_payment(code, **kwargs)
+
     def generate_digest(self, data):
         return self.webhook_hash
 
@@ -203,6 +227,19 @@ class FlutterwaveAPI:
     def other_payment_info(self, **kwargs):
         return self.transaction_api.build_transaction_obj(**kwargs)
 
+    async def async_other_payment_info(self, **kwargs):
+        return self.other_payment_info(**kwargs)
+
 
 def get_js_script():
     return "https://checkout.flutterwave.com/v3.js"
+
+
+def build_flutterwave(tenant: TenantRecord):
+    return FlutterwaveAPI(
+        public_key=tenant.public_key,
+        secret_key=tenant.secret_key,
+        django=False,
+        base_url=settings.FLUTTERWAVE_BASE_URL,
+        webhook_hash=tenant.identifier,
+    )
@@ -0,0 +1,150 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import threading
+import typing
+
+from payments_service import settings
+
+REDACTED = "***"
+REDACTED_KEYS = frozenset(
+    ["secret_key", "webhook_secret", "authorization", "password", "client_secret"]
+)
+# Attributes every LogRecord has; anything else was passed through ``extra``.
+_RECORD_ATTRS = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {
+    "message",
+    "asctime",
+}
+
+
+def redact(value):
+    """Copy of ``value`` with every secret field masked, at any depth."""
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if str(key).lower() in REDACTED_KEYS else redact(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        return [redact(item) for item in value]
+    return value
+
+
+class JSONFormatter(logging.Formatter):
+    """One JSON object per line with the message, level, logger name and any
+    fields passed through ``extra``, secrets redacted."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(redact(entry), default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of the records of each level, e.g. ``{"DEBUG":
+    0.1}`` keeps one debug line in ten. Levels not listed are always kept."""
+
+    def __init__(self, rates: typing.Mapping[str, float]):
+        super().__init__()
+        self.rates = {
+            logging.getLevelName(level.upper()): rate for level, rate in rates.items()
+        }
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno)
+        return rate is None or random.random() < rate
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread without formatting them on the
+    caller's thread. When the queue is full the record is dropped instead of
+    blocking the event loop."""
+
+    dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def parse_sample_rates(value: str) -> typing.Dict[str, float]:
+    rates = {}
+    for item in value.split(","):
+        if "=" in item:
+            level, rate = item.split("=", 1)
+            rates[level.strip().upper()] = float(rate)
+    return rates
+
+
+_listener: typing.Optional[logging.handlers.QueueListener] = None
+_lock = threading.Lock()
+
+
+def configure(
+    level: typing.Optional[str] = None,
+    sample_rates: typing.Optional[typing.Mapping[str, float]] = None,
+    stream=None,
+    queue_size: typing.Optional[int] = None,
+) -> logging.Logger:
+    """Route the ``payments_service`` loggers through a bounded queue to a
+    background thread that formats and writes the records."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+        logger = logging.getLogger("payments_service")
+        for handler in list(logger.handlers):
+            logger.removeHandler(handler)
+        records = queue.Queue(
+            settings.LOG_QUEUE_SIZE if queue_size is None else queue_size
+        )
+        handler = DroppingQueueHandler(records)
+        if sample_rates is None:
+            sample_rates = parse_sample_rates(settings.LOG_SAMPLE_RATES)
+        handler.addFilter(SamplingFilter(sample_rates))
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(JSONFormatter())
+        _listener = logging.handlers.QueueListener(records, output)
+        _listener.start()
+        logger.addHandler(handler)
+        logger.setLevel((level or settings.LOG_LEVEL).upper())
+        logger.propagate = False
+        return logger
+
+
+def shutdown():
+    """Flush queued records and stop the background thread."""
+    global _listener
+    with _lock:
+        if _listener is not None:
+            try:
+                _listener.stop()
+            except queue.Full:
+                pass
+            _listener = None
+
+
+def get_logger(name: str) -> logging.Logger:
+    if _listener is None:
+        configure()
+    return logging.getLogger(name)
+
+
+atexit.register(shutdown)
@@ -0,0 +1,266 @@
+import asyncio
+import random
+import sqlite3
+import threading
+import time
+import typing
+from urllib.parse import urlsplit
+
+from payments_service import fastjson
+from payments_service import files
+from payments_service import metrics
+from payments_service import settings
+from payments_service import transport
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS outbox_next_attempt ON outbox (next_attempt);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT,
+    created REAL NOT NULL,
+    failed REAL NOT NULL
+);
+"""
+
+
+class Outbox:
+    """Durable queue of merchant webhook callbacks.
+
+    Every callback is written to SQLite before it is sent, then delivered by a
+    background worker with a global concurrency limit, a per-destination
+    limit and exponential backoff. Callbacks that still fail after
+    ``max_attempts`` are moved to the ``dead_letters`` table."""
+
+    def __init__(
+        self,
+        path: str,
+        concurrency: int = 50,
+        per_destination: int = 4,
+        max_attempts: int = 8,
+        base_delay: float = 2.0,
+        max_delay: float = 600.0,
+        lease: float = 60.0,
+    ):
+        self.path = path
+        self.concurrency = concurrency
+        self.per_destination = per_destination
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease = lease
+        self._db: typing.Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._loop: typing.Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: typing.Optional[asyncio.Event] = None
+        self._worker: typing.Optional[asyncio.Task] = None
+        self._inflight: typing.Dict[int, asyncio.Task] = {}
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    db = sqlite3.connect(
+                        files.private_file(self.path),
+                        check_same_thread=False,
+                        isolation_level=None,
+                    )
+                    db.execute("PRAGMA journal_mode=WAL")
+                    db.executescript(SCHEMA)
+                    self._db = db
+        return self._db
+
+    def _execute(self, query, params=()):
+        db = self.db
+        with self._lock:
+            return db.execute(query, params).fetchall()
+
+    def enqueue(self, url: str, payload: typing.Any) -> int:
+        """Persist a callback and wake the worker. Safe to call from any
+        thread."""
+        now = time.time()
+        db = self.db
+        with self._lock:
+            cursor = db.execute(
+                "INSERT INTO outbox (url, payload, next_attempt, created) "
+                "VALUES (?, ?, ?, ?)",
+                (url, fastjson.dumps(payload).decode(), now, now),
+            )
+        self.wake()
+        return cursor.lastrowid
+
+    def wake(self):
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def pending(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM outbox")[0][0]
+
+    def dead_letters(self, limit: int = 100) -> typing.List[typing.Dict]:
+        rows = self._execute(
+            "SELECT id, url, payload, attempts, last_error, failed "
+            "FROM dead_letters ORDER BY failed DESC LIMIT ?",
+            (limit,),
+        )
+        return [
+            {
+                "id": row[0],
+                "url": row[1],
+                "payload": fastjson.loads(row[2]),
+                "attempts": row[3],
+                "last_error": row[4],
+                "failed": row[5],
+            }
+            for row in rows
+        ]
+
+    def _claim(self, limit: int) -> typing.List[tuple]:
+        # Rows held by this worker are leased by pushing their next attempt
+        # into the future, so other processes sharing the file skip them.
+        # Leases of rows still in flight are renewed on every pass.
+        now = time.time()
+        db = self.db
+        with self._lock:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                rows = []
+                if limit > 0:
+                    rows = db.execute(
+                        "SELECT id, url, payload, attempts FROM outbox "
+                        "WHERE next_attempt <= ? ORDER BY next_attempt LIMIT ?",
+                        (now, limit),
+                    ).fetchall()
+                leased = list(self._inflight) + [row[0] for row in rows]
+                db.executemany(
+                    "UPDATE outbox SET next_attempt = ? WHERE id = ?",
+                    [(now + self.lease, row_id) for row_id in leased],
+                )
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        return rows
+
+    def _next_due(self) -> typing.Optional[float]:
+        return self._execute("SELECT MIN(next_attempt) FROM outbox")[0][0]
+
+    def backoff(self, attempts: int) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+
+    def _record_failure(self, row_id, url, payload, attempts, error):
+        now = time.time()
+        if attempts >= self.max_attempts:
+            db = self.db
+            with self._lock:
+                db.execute(
+                    "INSERT INTO dead_letters "
+                    "(id, url, payload, attempts, last_error, created, failed) "
+                    "SELECT id, url, payload, ?, ?, created, ? "
+                    "FROM outbox WHERE id = ?",
+                    (attempts, error, now, row_id),
+                )
+                db.execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+            return
+        self._execute(
+            "UPDATE outbox SET attempts = ?, next_attempt = ?, last_error = ? "
+            "WHERE id = ?",
+            (attempts, now + self.backoff(attempts), error, row_id),
+        )
+        self.wake()
+
+    async def _deliver(self, row, limits, destinations):
+        row_id, url, payload, attempts = row
+        async with limits, destinations[urlsplit(url).netloc]:
+            try:
+                response = await transport.async_request(
+                    "POST", url, json=fastjson.loads(payload)
+                )
+            except Exception as exc:
+                error = repr(exc)
+            else:
+                if response.status_code < 300:
+                    self._execute("DELETE FROM outbox WHERE id = ?", (row_id,))
+                    return
+                error = f"HTTP {response.status_code}"
+        self._record_failure(row_id, url, payload, attempts + 1, error)
+
+    async def run(self):
+        limits = asyncio.Semaphore(self.concurrency)
+        destinations: typing.Dict[str, asyncio.Semaphore] = {}
+        while True:
+            self._wakeup.clear()
+            for row in self._claim(self.concurrency - len(self._inflight)):
+                host = urlsplit(row[1]).netloc
+                if host not in destinations:
+                    destinations[host] = asyncio.Semaphore(self.per_destination)
+                task = asyncio.ensure_future(self._deliver(row, limits, destinations))
+                self._inflight[row[0]] = task
+                task.add_done_callback(
+                    lambda _, row_id=row[0]: self._inflight.pop(row_id, None)
+                )
+            timeout = self.lease / 2
+            next_due = self._next_due()
+            if next_due is not None:
+                timeout = min(timeout, next_due - time.time())
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), max(timeout, 0.05))
+            except asyncio.TimeoutError:
+                pass
+
+    def ensure_started(self):
+        """Start the delivery worker on the running event loop if it is not
+        already running there."""
+        loop = asyncio.get_event_loop()
+        if self._worker is not None and not self._worker.done():
+            if self._loop is loop:
+                return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._worker = loop.create_task(self.run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._inflight:
+            await asyncio.wait(set(self._inflight.values()), timeout=5)
+        self._loop = None
+        self._wakeup = None
+
+
+outbox = Outbox(
+    settings.OUTBOX_PATH,
+    concurrency=settings.OUTBOX_CONCURRENCY,
+    per_destination=settings.OUTBOX_PER_DESTINATION,
+    max_attempts=settings.OUTBOX_MAX_ATTEMPTS,
+    base_delay=settings.OUTBOX_BASE_DELAY,
+    max_delay=settings.OUTBOX_MAX_DELAY,
+)
+
+metrics.registry.gauge(
+    "payments_outbox_pending",
+    "Merchant webhook callbacks waiting to be delivered.",
+    outbox.pending,
+)
+metrics.registry.gauge(
+    "payments_outbox_in_flight",
+    "Merchant webhook callbacks currently being delivered by this worker.",
+    lambda: len(outbox._inflight),
+)
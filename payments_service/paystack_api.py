@@ -0,0 +1,83 @@
+from paystack.api.transaction import Transaction
+from paystack.utils import PaystackAPI
+
+from payments_service import settings
+from payments_service import transport
+from payments_service.tenants import TenantRecord
+
+
+class NewTransaction(Transaction):
+    def __init__(self, make_request, async_make_request=None, **kwargs):
+        super().__init__(make_request, **kwargs)
+        self.async_make_request = async_make_request
+
+    async def async_verify_payment(self, code, amount_only=True, **kwargs):
+        path = "/transaction/verify/{}".format(code)
+        response = await self.async_make_request("GET", path, hedge=True)
+        if amount_only:
+            return self.verify_result(response, **kwargs)
+        return self.result_format(response)
+
+    def verify_result(self, response, **kwargs):
+        if response.status_code == 200:
+            result = response.json()
+            data = result["data"]
+            amount = kwargs.get("amount")
+            if amount:
+                if float("%.0f" % data["amount"]) == float("%.0f" % float(amount)):
+                    return True, result["message"], data
+                return False, data["amount"]
+            return True, result["message"], data
+
+        if response.status_code >= 400:
+            return False, "Could not verify transaction"
+
+
+class NewPaystackAPI(transport.AsyncAdapterMixin, PaystackAPI):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.transaction_api = NewTransaction(
+            self.make_request,
+            async_make_request=self.async_make_request,
+            secret_key=self.secret_key,
+            public_key=self.public_key,
+        )
+
+    def make_request(self, method, path, **kwargs):
+        url = "{}{}".format(self.base_url, path)
+        headers = {
+            "Authorization": "Bearer {}".format(self.secret_key),
+            "Content-Type": "application/json",
+        }
+        return transport.request(method, url, headers=headers, **kwargs)
+
+    async def async_make_request(self, method, path, **kwargs):
+        url = "{}{}".format(self.base_url, path)
+        headers = {
+            "Authorization": "Bearer {}".format(self.secret_key),
+            "Content-Type": "application/json",
+        }
+        return await transport.async_request(method, url, headers=headers, **kwargs)
+
+    async def async_verify_payment(self, code, **kwargs):
+        return await self.transaction_api.async_verify_payment(code, **kwargs)
+
+    def processor_info(self, *args, **kwargs):
+        kwargs.pop("session_secret", None)
+        result = super().processor_info(*args, **kwargs)
+        result["p_amount"] = result["amount"] * 100
+        return result
+
+    def other_payment_info(self, **kwargs):
+        result = super().other_payment_info(**kwargs)
+        result["amount"] = result["amount"] * 100
+        return result
+
+
+def build_paystack(tenant: TenantRecord):
+    return NewPaystackAPI(
+        public_key=tenant.public_key,
+        secret_key=tenant.secret_key,
+        django=False,
+        base_url=settings.PAYSTACK_BASE_URL,
+    )
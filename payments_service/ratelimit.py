@@ -0,0 +1,149 @@
+"""Token buckets per tenant and route, checked before a request is routed.
+
+Every route with an ``{identifier}`` path parameter gets one bucket per
+identifier. Tenants can raise or lower their limit with the ``rate_limit``
+(requests per second) and ``rate_limit_burst`` columns of the payment sheet;
+those apply once the tenant's record has been loaded, and the defaults from
+``settings`` apply until then. A rate of 0 means no limit."""
+
+import math
+import time
+import typing
+from collections import OrderedDict
+
+from starlette.routing import BaseRoute, Match, Mount
+
+from payments_service import metrics
+from payments_service import service
+from payments_service import settings
+from payments_service.fastjson import JSONResponse
+
+rate_limited = metrics.registry.counter(
+    "payments_rate_limited_total",
+    "Requests rejected because the tenant's token bucket was empty.",
+    ("route",),
+)
+
+
+class TokenBucket:
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float, now: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Take a token. Returns 0 if there was one, otherwise how many seconds
+        until the next one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class RateLimiter:
+    """Token buckets keyed by ``(identifier, route)``. Only the ``maxsize``
+    most recently used buckets are kept; an evicted bucket starts full."""
+
+    def __init__(self, maxsize: int = 10000, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.timer = timer
+        self._buckets: "OrderedDict[tuple, TokenBucket]" = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def acquire(self, key: tuple, rate: float, burst: float) -> float:
+        """Take a token from ``key``'s bucket; see ``TokenBucket.take``."""
+        now = self.timer()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(rate, burst, now)
+            if len(self._buckets) > self.maxsize:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+            # The tenant's limits may have changed since the bucket was made.
+            bucket.rate = rate
+            bucket.burst = burst
+        return bucket.take(now)
+
+
+def parse_route_limits(value: str) -> typing.Dict[str, float]:
+    """``"verify_payments=1,build_payment_info=5"`` -> requests per second
+    by route name."""
+    limits = {}
+    for item in value.split(","):
+        if "=" in item:
+            route, rate = item.split("=", 1)
+            limits[route.strip()] = float(rate)
+    return limits
+
+
+route_limits = parse_route_limits(settings.RATE_LIMIT_ROUTES)
+limiter = RateLimiter(settings.RATE_LIMIT_SIZE)
+
+
+def limits(identifier: str, route: str) -> typing.Tuple[float, float]:
+    """``(rate, burst)`` for ``identifier`` on ``route``."""
+    rate = route_limits.get(route, settings.RATE_LIMIT)
+    burst = None
+    tenant = service.credential_cache.get(identifier)
+    if tenant is not None:
+        if tenant.rate_limit is not None:
+            rate = tenant.rate_limit
+        burst = tenant.rate_limit_burst
+    if burst is None:
+        burst = max(1.0, rate * settings.RATE_LIMIT_BURST)
+    return rate, burst
+
+
+def match_route(routes: typing.Sequence[BaseRoute], scope) -> typing.Optional[dict]:
+    """The child scope of the route ``scope`` will be dispatched to."""
+    for route in routes:
+        found, child = route.matches(scope)
+        if found != Match.FULL:
+            continue
+        if isinstance(route, Mount):
+            return match_route(route.routes, {**scope, **child})
+        return child
+    return None
+
+
+class RateLimitMiddleware:
+    """Answer 429 with ``Retry-After`` once a tenant has used up its bucket
+    for the route it is calling."""
+
+    def __init__(self, app, routes: typing.Sequence[BaseRoute]):
+        self.app = app
+        self.routes = routes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        child = match_route(self.routes, scope)
+        identifier = child and child.get("path_params", {}).get("identifier")
+        if not identifier:
+            await self.app(scope, receive, send)
+            return
+        endpoint = child["endpoint"]
+        route = getattr(endpoint, "__name__", "unknown")
+        rate, burst = limits(identifier, route)
+        wait = limiter.acquire((identifier, route), rate, burst) if rate > 0 else 0
+        if not wait:
+            await self.app(scope, receive, send)
+            return
+        rate_limited.inc(route=route)
+        # Label the request metrics with the route that was rejected.
+        scope["endpoint"] = endpoint
+        response = JSONResponse(
+            {"status": False, "msg": "Too many requests"},
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+        await response(scope, receive, send)
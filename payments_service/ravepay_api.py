@@ -0,0 +1,22 @@
+from ravepay.utils import RavepayAPI
+
+from payments_service import transport
+from payments_service import webhook_signals  # noqa: F401 connects receivers
+from payments_service.tenants import TenantRecord
+
+
+class NewRavepayAPI(transport.AsyncAdapterMixin, RavepayAPI):
+    def make_request(self, method, path, **kwargs):
+        url = "{}{}".format(self.base_url, path)
+        headers = {"Content-Type": "application/json"}
+        return transport.request(method, url, headers=headers, **kwargs)
+
+
+def build_ravepay(tenant: TenantRecord):
+    return NewRavepayAPI(
+        public_key=tenant.public_key,
+        secret_key=tenant.secret_key,
+        test=tenant.test,
+        django=False,
+        webhook_hash=tenant.identifier,
+    )
@@ -1,161 +1,286 @@
-import typing
-
-from starlette.responses import JSONResponse
-from starlette.routing import Route
-from starlette.requests import Request
-from starlette.background import BackgroundTask
-from payments_service import service
-
-
-async def payment_credentials(request: Request):
-    identifier = request.query_params.get("identifier")
-    if not identifier:
-        return JSONResponse(
-            {"status": False, "msg": "Missing `identifier` as query params"}
-        )
-    result = await service.post(identifier)
-    if result:
-        return JSONResponse({"status": True, "data": result})
-    return JSONResponse({"status": False, "msg": "Error fetching credentials"})
-
-
-async def webhook_callback(request: Request):
-    key = "verif-hash" or "x-paystack-signature"
-    signature = request.headers.get(key)
-    body = await request.body()
-
-    async def task():
-        payment_instance = await service.build_payment_instance(signature)
-        if signature == "flutterwave_dev":
-            payment_instance = await service.build_payment_instance("ravepay_dev")
-        if payment_instance:
-            payment_instance.instance.webhook_api.verify(
-                signature,
-                body,
-                full_auth=True,
-                full=False,
-                callback_func=payment_instance.webhook_callback_func,
-            )
-
-    return JSONResponse({"status": "Success"}, background=BackgroundTask(task))
-
-
-async def generate_payment_account_no(request: Request):
-    identifier = request.path_params["identifier"]
-    params = await request.json()
-    account_name = params.get("account_name")
-    client_email = params.get("client_email")
-    permanent = params.get("permanent")
-    order = params.get("order")
-    if account_name and client_email:
-        payment_instance = await service.build_payment_instance(identifier)
-        response = payment_instance.instance.transaction_api.create_payment_account(
-            account_name, client_email, is_permanent=permanent
-        )
-        if response[0]:
-            return JSONResponse(
-                {"status": True, "msg": response[1], "data": response[2]}
-            )
-        return JSONResponse({"status": False, "msg": response[1]}, status_code=400)
-    return JSONResponse(
-        {"status": False, "msg": "Missing account name or client email"},
-        status_code=400,
-    )
-
-
-async def verify_payment(request: Request):
-    identifier = request.path_params["identifier"]
-    amount = request.query_params.get("amount")
-    ref = request.query_params.get("txref")
-    trxref = request.query_params.get("trxref")
-    amount_only = request.query_params.get("amount_only") or ""
-    if amount and ref:
-        a_only = amount_only.lower().strip() == "true"
-        payment_instance = await service.build_payment_instance(identifier)
-        if payment_instance.kind == "paystack" and trxref:
-            ref = trxref
-        if payment_instance.kind == "flutterwave" and trxref:
-            ref = trxref
-        if payment_instance.kind == "stripe" and trxref:
-            ref = trxref
-
-        result = payment_instance.instance.verify_payment(
-            ref, amount=amount, amount_only=a_only
-        )
-        if result[0]:
-            if a_only:
-                return JSONResponse({"status": result[0], "msg": result[1]})
-            return JSONResponse(
-                {"status": result[0], "msg": result[1], "data": result[2]}
-            )
-        return JSONResponse({"status": False, "msg": "Verification Failed"})
-    return JSONResponse(
-        {"status": False, "msg": "missing `amount` or `txref` query parameters"},
-        status_code=400,
-    )
-
-
-async def client_payment_object(request: Request):
-    identifier = request.path_params["identifier"]
-    body = await request.json()
-    amount = body.get("amount")
-    currency = body.get("currency")
-    order_id = body.get("order")
-    user_info = body.get("user") or {}
-    return_url = body.get("return_url")
-    processor_info = body.get("processor_info") or {}
-
-    if not identifier:
-        return JSONResponse(
-            {"status": False, "msg": "Invalid identifier"}, status_code=400
-        )
-
-    payment_instance = await service.build_payment_instance(identifier)
-    if not all([amount, order_id]):
-        return JSONResponse(
-            {"status": False, "msg": "missing `amount` or `order`"}, status_code=400
-        )
-    if not payment_instance:
-        return JSONResponse(
-            {"status": False, "msg": "Invalid identifier"}, status_code=400
-        )
-    redirect_url = payment_instance.build_redirect_url(amount, order_id)
-    other_info = payment_instance.instance.other_payment_info(
-        currency=currency,
-        **{
-            **user_info,
-            "order": order_id,
-            "callback_url": redirect_url,
-            "amount": amount,
-            "return_url": return_url,
-            **processor_info,
-        },
-    )
-    obj = payment_instance.instance.processor_info(
-        amount,
-        redirect_url=redirect_url,
-        session_secret=other_info.get("session_secret"),
-    )
-    return JSONResponse(
-        {
-            "status": True,
-            "data": {
-                "processor_button_info": other_info,
-                "payment_obj": obj,
-                "kind": payment_instance.kind,
-            },
-        }
-    )
-
-
-routes = [
-    # Route("/credentials", payment_credentials),
-    Route("/webhook", webhook_callback, methods=["POST"]),
-    Route("/verify-payment/{identifier}", verify_payment),
-    Route(
-        "/generate-account-no/{identifier}",
-        generate_payment_account_no,
-        methods=["POST"],
-    ),
-    Route("/build-payment-info/{identifier}", client_payment_object, methods=["POST"]),
-]
+import asyncio
+import numbers
+import typing
+
+from starlette.responses import StreamingResponse
+from starlette.routing import Route
+from starlette.requests import Request
+from starlette.background import BackgroundTask
+from payments_service import fastjson
+from payments_service import service
+from payments_service import settings
+from payments_service.cache import TTLCache
+from payments_service.fastjson import JSONResponse
+from payments_service.outbox import outbox
+from payments_service.service import FINAL_STATUSES
+
+verification_cache = TTLCache(
+    maxsize=settings.VERIFICATION_CACHE_SIZE, ttl=settings.VERIFICATION_CACHE_TTL
+)
+
+
+async def payment_credentials(request: Request):
+    identifier = request.query_params.get("identifier")
+    if not identifier:
+        return JSONResponse(
+            {"status": False, "msg": "Missing `identifier` as query params"}
+        )
+    result = await service.post(identifier)
+    if result:
+        return JSONResponse({"status": True, "data": result})
+    return JSONResponse({"status": False, "msg": "Error fetching credentials"})
+
+
+async def webhook_callback(request: Request):
+    key = "verif-hash" or "x-paystack-signature"
+    signature = request.headers.get(key)
+    if not service.tenant_known(signature):
+        return JSONResponse(
+            {"status": False, "msg": "Unknown identifier"}, status_code=404
+        )
+    body = await request.body()
+    try:
+        payload = fastjson.loads(body)
+    except ValueError:
+        payload = None
+    event_key = service.webhook_event_key(signature, payload)
+    if event_key is not None and event_key in service.webhook_events:
+        # Redelivery of an event that was already processed.
+        return JSONResponse({"status": "Success"})
+    outbox.ensure_started()
+
+    async def task():
+        payment_instance = await service.build_payment_instance(signature)
+        if signature == "flutterwave_dev":
+            payment_instance = await service.build_payment_instance("ravepay_dev")
+        if payment_instance:
+            verified = await payment_instance.instance.async_verify_webhook(
+                signature,
+                body,
+                payload,
+                full_auth=True,
+                full=False,
+                callback_func=payment_instance.webhook_callback_func,
+            )
+            # Only remembered once verified and handled, so a forged or
+            # failed delivery cannot hide the provider's own redelivery.
+            if verified and event_key is not None:
+                service.webhook_events.set(event_key, True)
+
+    return JSONResponse({"status": "Success"}, background=BackgroundTask(task))
+
+
+async def generate_payment_account_no(request: Request):
+    identifier = request.path_params["identifier"]
+    params = await fastjson.read_json(request)
+    account_name = params.get("account_name")
+    client_email = params.get("client_email")
+    permanent = params.get("permanent")
+    order = params.get("order")
+    if account_name and client_email:
+        payment_instance = await service.build_payment_instance(identifier)
+        response = await payment_instance.instance.async_create_payment_account(
+            account_name, client_email, is_permanent=permanent
+        )
+        if response[0]:
+            return JSONResponse(
+                {"status": True, "msg": response[1], "data": response[2]}
+            )
+        return JSONResponse({"status": False, "msg": response[1]}, status_code=400)
+    return JSONResponse(
+        {"status": False, "msg": "Missing account name or client email"},
+        status_code=400,
+    )
+
+
+def payment_reference(kind, txref, trxref=None):
+    if kind in ("paystack", "flutterwave", "stripe") and trxref:
+        return trxref
+    return txref
+
+
+def is_final_verification(result) -> bool:
+    """Settled transactions, successful verifications and amount mismatches
+    reported by the provider will not change. Errors, pending transactions and
+    incomplete Stripe sessions might, so they are checked again next time.
+
+    A ``(verified, msg, transaction)`` result is final once the provider's
+    transaction status is, whatever the verdict. Stripe's failures carry a
+    summary of the session instead and are always checked again."""
+    if len(result) == 3 and isinstance(result[2], dict):
+        return result[2].get("status") in FINAL_STATUSES
+    if result[0]:
+        return True
+    return len(result) == 2 and isinstance(result[1], numbers.Number)
+
+
+async def cached_verification(identifier, payment_instance, ref, amount, amount_only):
+    """Verify ``ref`` with the provider, sharing the call with concurrent
+    identical checks and reusing final outcomes."""
+    key = (identifier, ref, str(amount), amount_only)
+    return await verification_cache.get_or_fetch(
+        key,
+        lambda: payment_instance.instance.async_verify_payment(
+            ref, amount=amount, amount_only=amount_only
+        ),
+        cache_if=is_final_verification,
+    )
+
+
+def verification_response(result, amount_only):
+    if result[0]:
+        if amount_only:
+            return {"status": result[0], "msg": result[1]}
+        return {"status": result[0], "msg": result[1], "data": result[2]}
+    return {"status": False, "msg": "Verification Failed"}
+
+
+async def verify_payment(request: Request):
+    identifier = request.path_params["identifier"]
+    amount = request.query_params.get("amount")
+    ref = request.query_params.get("txref")
+    trxref = request.query_params.get("trxref")
+    amount_only = request.query_params.get("amount_only") or ""
+    if amount and ref:
+        a_only = amount_only.lower().strip() == "true"
+        payment_instance = await service.build_payment_instance(identifier)
+        ref = payment_reference(payment_instance.kind, ref, trxref)
+
+        result = await cached_verification(
+            identifier, payment_instance, ref, amount, a_only
+        )
+        return JSONResponse(verification_response(result, a_only))
+    return JSONResponse(
+        {"status": False, "msg": "missing `amount` or `txref` query parameters"},
+        status_code=400,
+    )
+
+
+async def verify_payments(request: Request):
+    identifier = request.path_params["identifier"]
+    try:
+        body = await fastjson.read_json(request)
+    except ValueError:
+        body = None
+    if isinstance(body, list):
+        body = {"payments": body}
+    payments = body.get("payments") if isinstance(body, dict) else None
+    if not payments or not isinstance(payments, list):
+        return JSONResponse(
+            {"status": False, "msg": "missing `payments`"}, status_code=400
+        )
+    max_items = settings.BATCH_VERIFY_MAX_ITEMS
+    if len(payments) > max_items:
+        return JSONResponse(
+            {"status": False, "msg": f"at most {max_items} payments per request"},
+            status_code=400,
+        )
+    if not all(
+        isinstance(payment, dict) and payment.get("amount") and payment.get("txref")
+        for payment in payments
+    ):
+        return JSONResponse(
+            {"status": False, "msg": "every payment needs `amount` and `txref`"},
+            status_code=400,
+        )
+    payment_instance = await service.build_payment_instance(identifier)
+    if not payment_instance:
+        return JSONResponse(
+            {"status": False, "msg": "Invalid identifier"}, status_code=400
+        )
+    a_only = bool(body.get("amount_only"))
+    limit = asyncio.Semaphore(settings.BATCH_VERIFY_CONCURRENCY)
+
+    async def verify(payment):
+        ref = payment_reference(
+            payment_instance.kind, payment["txref"], payment.get("trxref")
+        )
+        async with limit:
+            try:
+                result = await cached_verification(
+                    identifier, payment_instance, ref, payment["amount"], a_only
+                )
+                # None or a malformed result fails this payment, not the batch.
+                response = verification_response(result, a_only)
+            except Exception:
+                response = verification_response(
+                    (False, "Could not verify transaction"), a_only
+                )
+        return {"txref": payment["txref"], **response}
+
+    verifications = [verify(payment) for payment in payments]
+    if request.query_params.get("stream") == "true":
+
+        async def stream():
+            for verification in asyncio.as_completed(verifications):
+                yield fastjson.dumps(await verification) + b"\n"
+
+        return StreamingResponse(stream(), media_type="application/x-ndjson")
+    return JSONResponse({"status": True, "data": await asyncio.gather(*verifications)})
+
+
+async def client_payment_object(request: Request):
+    identifier = request.path_params["identifier"]
+    body = await fastjson.read_json(request)
+    amount = body.get("amount")
+    currency = body.get("currency")
+    order_id = body.get("order")
+    user_info = body.get("user") or {}
+    return_url = body.get("return_url")
+    processor_info = body.get("processor_info") or {}
+
+    if not identifier:
+        return JSONResponse(
+            {"status": False, "msg": "Invalid identifier"}, status_code=400
+        )
+
+    payment_instance = await service.build_payment_instance(identifier)
+    if not all([amount, order_id]):
+        return JSONResponse(
+            {"status": False, "msg": "missing `amount` or `order`"}, status_code=400
+        )
+    if not payment_instance:
+        return JSONResponse(
+            {"status": False, "msg": "Invalid identifier"}, status_code=400
+        )
+    redirect_url = payment_instance.build_redirect_url(amount, order_id)
+    other_info = await payment_instance.instance.async_other_payment_info(
+        currency=currency,
+        **{
+            **user_info,
+            "order": order_id,
+            "callback_url": redirect_url,
+            "amount": amount,
+            "return_url": return_url,
+            **processor_info,
+        },
+    )
+    obj = payment_instance.instance.processor_info(
+        amount,
+        redirect_url=redirect_url,
+        session_secret=other_info.get("session_secret"),
+    )
+    return JSONResponse(
+        {
+            "status": True,
+            "data": {
+                "processor_button_info": other_info,
+                "payment_obj": obj,
+                "kind": payment_instance.kind,
+            },
+        }
+    )
+
+
+routes = [
+    # Route("/credentials", payment_credentials),
+    Route("/webhook", webhook_callback, methods=["POST"]),
+    Route("/verify-payment/{identifier}", verify_payment),
+    Route("/verify-payments/{identifier}", verify_payments, methods=["POST"]),
+    Route(
+        "/generate-account-no/{identifier}",
+        generate_payment_account_no,
+        methods=["POST"],
+    ),
+    Route("/build-payment-info/{identifier}", client_payment_object, methods=["POST"]),
+]
@@ -0,0 +1,272 @@
+"""Re-verify many transactions against their providers and report the ones
+that do not match.
+
+Reads a CSV (``identifier,ref,amount`` header) or NDJSON file one row at a
+time, verifies the rows concurrently through each tenant's adapter and
+writes one NDJSON line per mismatch, or per row that could not be read, as
+soon as it is known::
+
+    python -m payments_service.reconcile payments.csv --rate stripe=20 > report.ndjson
+
+Each tenant's credentials are resolved once per run, and calls to each
+provider are held to ``--rate`` requests per second.
+"""
+
+import argparse
+import asyncio
+import collections
+import csv
+import numbers
+import sys
+import typing
+
+from payments_service import fastjson
+from payments_service import log
+from payments_service import ratelimit
+from payments_service import service
+
+logger = log.get_logger(__name__)
+
+Row = typing.Dict[str, typing.Any]
+
+MATCH = "match"
+AMOUNT_MISMATCH = "amount_mismatch"
+PENDING = "pending"
+FAILED = "failed"
+UNKNOWN_TENANT = "unknown_tenant"
+ERROR = "error"
+
+
+def read_records(
+    lines: typing.Iterable[str], format: str
+) -> typing.Iterator[typing.Tuple[int, typing.Any]]:
+    """``(line number, record)`` for every row; the record of an NDJSON line
+    that is not valid JSON is ``None``."""
+    if format == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, fastjson.loads(line)
+        except ValueError:
+            yield number, None
+
+
+def read_rows(lines: typing.Iterable[str], format: str) -> typing.Iterator[Row]:
+    """``identifier``, ``ref`` and ``amount`` of every row, read lazily.
+    ``txref`` and ``reference`` are accepted for ``ref``. Rows that cannot be
+    verified come out with ``status`` set to ``error`` and their line."""
+    for number, record in read_records(lines, format):
+        if not isinstance(record, dict):
+            yield {
+                "identifier": None,
+                "ref": None,
+                "amount": None,
+                "status": ERROR,
+                "line": number,
+                "msg": "not a JSON object",
+            }
+            continue
+        row = {
+            "identifier": record.get("identifier") or None,
+            "ref": record.get("ref") or record.get("txref") or record.get("reference"),
+            "amount": record.get("amount") or None,
+        }
+        if not row["identifier"] or not row["ref"]:
+            row.update(status=ERROR, line=number, msg="missing identifier or ref")
+        yield row
+
+
+def classify(result, amount=None) -> typing.Tuple[str, typing.Dict[str, typing.Any]]:
+    """Status of an adapter's ``verify_payment`` result for a row expecting
+    ``amount``, and what the provider said about it.
+
+    Not every adapter checks the transaction's status or amount, so a
+    verified result only matches once the transaction it carries was settled
+    successfully and, when the row has an amount, for that amount."""
+    if result and len(result) == 2 and isinstance(result[1], numbers.Number):
+        return AMOUNT_MISMATCH, {"actual_amount": result[1]}
+    data = result[2] if result and len(result) > 2 else None
+    if not isinstance(data, dict):
+        data = {}
+    status = data.get("status")
+    if result and result[0] and (not status or status in service.SUCCESSFUL_STATUSES):
+        paid = data.get("amount")
+        if (
+            amount
+            and paid is not None
+            and round(float(paid), 2) != round(float(amount), 2)
+        ):
+            return AMOUNT_MISMATCH, {"actual_amount": paid}
+        return MATCH, {}
+    details = {"msg": result[1] if result and len(result) > 1 else None}
+    if status:
+        details["provider_status"] = status
+        if status not in service.FINAL_STATUSES:
+            return PENDING, details
+    return FAILED, details
+
+
+class Reconciler:
+    """Verifies rows with at most ``concurrency`` calls in flight and at most
+    ``rates[kind]`` (or ``default_rate``) calls per second to each provider.
+    A rate of 0 means unlimited."""
+
+    def __init__(
+        self,
+        concurrency: int = 20,
+        rates: typing.Optional[typing.Mapping[str, float]] = None,
+        default_rate: float = 10.0,
+    ):
+        self.concurrency = concurrency
+        self.rates = dict(rates or {})
+        self.default_rate = default_rate
+        self.limiter = ratelimit.RateLimiter()
+        self.counts: typing.Counter[str] = collections.Counter()
+        self._instances: typing.Dict[str, asyncio.Future] = {}
+
+    async def payment_instance(self, identifier: str):
+        instance = self._instances.get(identifier)
+        if instance is None:
+            instance = self._instances[identifier] = asyncio.ensure_future(
+                service.build_payment_instance(identifier)
+            )
+        try:
+            return await instance
+        except Exception:
+            # Only keep resolutions that worked; the next row tries again.
+            if self._instances.get(identifier) is instance:
+                del self._instances[identifier]
+            raise
+
+    async def throttle(self, kind: str):
+        rate = self.rates.get(kind, self.default_rate)
+        if rate <= 0:
+            return
+        while True:
+            wait = self.limiter.acquire((kind,), rate, max(1.0, rate))
+            if not wait:
+                return
+            await asyncio.sleep(wait)
+
+    async def verify(self, row: Row) -> Row:
+        if row.get("status") == ERROR:
+            return row
+        report = {**row, "status": ERROR}
+        try:
+            payment_instance = await self.payment_instance(row["identifier"])
+            if payment_instance is None:
+                report["status"] = UNKNOWN_TENANT
+                return report
+            await self.throttle(payment_instance.kind)
+            result = await payment_instance.instance.async_verify_payment(
+                row["ref"], amount=row["amount"], amount_only=True
+            )
+            report["status"], details = classify(result, row["amount"])
+            report.update(details)
+        except Exception as exc:
+            logger.warning("reconciliation failed", exc_info=True, extra=row)
+            report["msg"] = repr(exc)
+        return report
+
+    async def run(
+        self,
+        rows: typing.Iterable[Row],
+        write: typing.Callable[[Row], None],
+        include_matches: bool = False,
+    ) -> typing.Counter[str]:
+        """Verify every row, passing each report that is not a match (or every
+        report, with ``include_matches``) to ``write`` as soon as it is done.
+        Only ``concurrency`` rows are held in memory at a time."""
+        slots = asyncio.Semaphore(self.concurrency)
+        pending: typing.Set[asyncio.Future] = set()
+
+        async def check(row):
+            try:
+                report = await self.verify(row)
+            finally:
+                slots.release()
+            self.counts[report["status"]] += 1
+            if include_matches or report["status"] != MATCH:
+                write(report)
+
+        for row in rows:
+            await slots.acquire()
+            task = asyncio.ensure_future(check(row))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+        return self.counts
+
+
+async def reconcile(
+    rows: typing.Iterable[Row], output, include_matches: bool = False, **options
+) -> typing.Counter[str]:
+    """Run a ``Reconciler`` built with ``options`` over ``rows``, writing the
+    report as NDJSON to the binary stream ``output``."""
+
+    def write(report):
+        output.write(fastjson.dumps(report) + b"\n")
+        output.flush()
+
+    await service.credential_backend.start()
+    try:
+        return await Reconciler(**options).run(rows, write, include_matches)
+    finally:
+        await service.credential_backend.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m payments_service.reconcile",
+        description=__doc__.splitlines()[0],
+    )
+    parser.add_argument("input", help="CSV or NDJSON file, or - for stdin")
+    parser.add_argument("--format", choices=["csv", "ndjson"])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument(
+        "--rate",
+        action="append",
+        default=[],
+        help="requests per second to one provider, e.g. stripe=20 (repeatable)",
+    )
+    parser.add_argument(
+        "--default-rate",
+        type=float,
+        default=10.0,
+        help="requests per second to providers without --rate, 0 for no limit",
+    )
+    parser.add_argument(
+        "--all", action="store_true", help="report matching rows as well"
+    )
+    args = parser.parse_args(argv)
+
+    # The report goes to stdout, so keep the logs out of it.
+    log.configure(stream=sys.stderr)
+    format = args.format or ("csv" if args.input.endswith(".csv") else "ndjson")
+    source = sys.stdin if args.input == "-" else open(args.input, newline="")
+    with source:
+        counts = asyncio.run(
+            reconcile(
+                read_rows(source, format),
+                sys.stdout.buffer,
+                concurrency=args.concurrency,
+                rates=ratelimit.parse_route_limits(",".join(args.rate)),
+                default_rate=args.default_rate,
+                include_matches=args.all,
+            )
+        )
+    print(
+        ", ".join(f"{status}: {count}" for status, count in sorted(counts.items()))
+        or "no rows",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,157 +1,213 @@
-import asyncio
-from paystack.api.transaction import Transaction
-import requests
-import typing
-from payments_service import settings
-from ravepay.utils import RavepayAPI
-from paystack.utils import PaystackAPI
-from ravepay.api import signals
-from dispatch import receiver
-from .flutterwave import FlutterwaveAPI
-from .stripe_payment import StripeAPI
-
-
-@receiver(signals.successful_payment_signal)
-def payment_signal(sender, **kwargs):
-    callback_func = kwargs.pop("callback_func")
-    signal = kwargs.pop("signal")
-    callback_func(kwargs)
-
-
-@receiver(signals.event_signal)
-def event_signal(sender, **kwargs):
-    callback_func = kwargs.pop("callback_func")
-    signal = kwargs.pop("signal")
-    callback_func(kwargs)
-
-
-async def loop_helper(callback):
-    loop = asyncio.get_event_loop()
-    future = loop.run_in_executor(None, callback)
-    return await future
-
-
-class NewTransaction(Transaction):
-    def verify_result(self, response, **kwargs):
-        if response.status_code == 200:
-            result = response.json()
-            data = result["data"]
-            amount = kwargs.get("amount")
-            if amount:
-                if float("%.0f" % data["amount"]) == float("%.0f" % float(amount)):
-                    return True, result["message"]
-                return False, data["amount"]
-            return True, result["message"], data
-
-        if response.status_code >= 400:
-            return False, "Could not verify transaction"
-
-
-class NewPaystackAPI(PaystackAPI):
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.transaction_api = NewTransaction(
-            self.make_request, secret_key=self.secret_key, public_key=self.public_key
-        )
-
-    def processor_info(self, *args, **kwargs):
-        kwargs.pop("session_secret", None)
-        result = super().processor_info(*args, **kwargs)
-        result["p_amount"] = result["amount"] * 100
-        return result
-
-    def other_payment_info(self, **kwargs):
-        result = super().other_payment_info(**kwargs)
-        result["amount"] = result["amount"] * 100
-        return result
-
-
-class PaymentInstance:
-    def __init__(self, post_params):
-        self.post_params = post_params
-
-    @property
-    def identifier(self):
-        return self.post_params["id"]
-
-    @property
-    def kind(self):
-        return self.post_params["type"]
-
-    @property
-    def instance(self):
-        if self.post_params["type"] == "ravepay":
-            is_dev = self.post_params["test"] == "TRUE"
-            return RavepayAPI(
-                public_key=self.post_params["public_key"],
-                secret_key=self.post_params["secret_key"],
-                test=is_dev,
-                django=False,
-                webhook_hash=self.post_params["id"],
-            )
-        if self.post_params["type"] == "paystack":
-            return NewPaystackAPI(
-                public_key=self.post_params["public_key"],
-                secret_key=self.post_params["secret_key"],
-                django=False,
-                base_url="https://api.paystack.co",
-            )
-        if self.post_params["type"] == "flutterwave":
-            return FlutterwaveAPI(
-                public_key=self.post_params["public_key"],
-                secret_key=self.post_params["secret_key"],
-                django=False,
-                base_url="https://api.flutterwave.com/v3",
-                webhook_hash=self.post_params["id"],
-            )
-        if self.post_params["type"] == "stripe":
-            return StripeAPI(
-                public_key=self.post_params["public_key"],
-                secret_key=self.post_params["secret_key"],
-                django=False,
-                id=self.post_params["id"],
-            )
-
-    @property
-    def callback_url(self):
-        return self.post_params["webhook_url"]
-
-    def build_redirect_url(self, amount, order_id):
-        if self.kind == "paystack":
-            amount = amount * 100
-        return f"{settings.HOST_URL}/verify-payment/{self.identifier}?amount={amount}&txref={order_id}&amount_only=true"
-
-    def webhook_callback_func(self, params):
-        if self.callback_url:
-            print(self.callback_url)
-            result = requests.post(self.callback_url, json=params)
-            print(result.status_code)
-
-
-async def post(_id):
-    def fetch():
-        result = requests.post(
-            settings.NOW_SHEET_SERVICE + "/read-single",
-            json={
-                "link": settings.PAYMENT_SHEET,
-                "key": "id",
-                "sheet": "Sheet1",
-                "value": _id,
-            },
-        )
-        print("result", result)
-
-        print("json", result.text)
-        print("id", {"id": _id})
-        if result.status_code < 400:
-            return result.json()["data"]
-
-        return None
-
-    return await loop_helper(fetch)
-
-
-async def build_payment_instance(_id) -> typing.Optional[PaymentInstance]:
-    result = await post(_id)
-    if result:
-        return PaymentInstance(result)
+import asyncio
+import importlib
+import time
+import typing
+from payments_service import credentials
+from payments_service import log
+from payments_service import metrics
+from payments_service import settings
+from payments_service.cache import TTLCache
+from payments_service.outbox import outbox
+from payments_service.tenants import TenantRecord
+
+logger = log.get_logger(__name__)
+
+
+async def loop_helper(callback):
+    loop = asyncio.get_event_loop()
+    future = loop.run_in_executor(None, callback)
+    return await future
+
+
+class ProviderRegistry(dict):
+    """Maps a tenant ``type`` to the factory that builds its adapter.
+
+    A factory can be registered as a ``"module:function"`` string; the module,
+    and the provider SDK it pulls in, is then only imported the first time a
+    tenant of that type is seen instead of on every cold start."""
+
+    def __getitem__(self, kind):
+        factory = super().__getitem__(kind)
+        if isinstance(factory, str):
+            module, _, name = factory.partition(":")
+            factory = getattr(importlib.import_module(module), name)
+            self[kind] = factory
+        return factory
+
+    def get(self, kind, default=None):
+        try:
+            return self[kind]
+        except KeyError:
+            return default
+
+    def resolve_all(self):
+        """Import every provider now, e.g. to warm a long-running worker."""
+        for kind in list(self):
+            self[kind]
+
+
+adapter_factories = ProviderRegistry(
+    {
+        "ravepay": "payments_service.ravepay_api:build_ravepay",
+        "paystack": "payments_service.paystack_api:build_paystack",
+        "flutterwave": "payments_service.flutterwave:build_flutterwave",
+        "stripe": "payments_service.stripe_payment:build_stripe",
+    }
+)
+
+# Transaction statuses the providers will not move away from.
+SUCCESSFUL_STATUSES = frozenset(["success", "successful"])
+FINAL_STATUSES = SUCCESSFUL_STATUSES | {"failed", "reversed"}
+
+# identifier -> (credentials the adapter was built from, adapter)
+_adapters: typing.Dict[str, typing.Tuple[tuple, typing.Any]] = {}
+
+
+def get_adapter(tenant: TenantRecord):
+    """Return the provider adapter for ``tenant``, reusing the one built on a
+    previous request unless the tenant's credentials have changed since."""
+    cached = _adapters.get(tenant.identifier)
+    if cached is not None and cached[0] == tenant.credentials:
+        return cached[1]
+    factory = adapter_factories.get(tenant.kind)
+    if factory is None:
+        return None
+    adapter = factory(tenant)
+    _adapters[tenant.identifier] = (tenant.credentials, adapter)
+    return adapter
+
+
+class PaymentInstance:
+    __slots__ = ("tenant",)
+
+    def __init__(self, tenant: typing.Union[TenantRecord, typing.Mapping]):
+        if not isinstance(tenant, TenantRecord):
+            tenant = TenantRecord.from_row(tenant)
+        self.tenant = tenant
+
+    @property
+    def post_params(self):
+        return self.tenant.row
+
+    @property
+    def identifier(self):
+        return self.tenant.identifier
+
+    @property
+    def kind(self):
+        return self.tenant.kind
+
+    @property
+    def instance(self):
+        return get_adapter(self.tenant)
+
+    @property
+    def callback_url(self):
+        return self.tenant.webhook_url
+
+    def build_redirect_url(self, amount, order_id):
+        if self.kind == "paystack":
+            amount = amount * 100
+        return f"{settings.HOST_URL}/verify-payment/{self.identifier}?amount={amount}&txref={order_id}&amount_only=true"
+
+    def webhook_callback_func(self, params):
+        if self.callback_url:
+            logger.info(
+                "queueing merchant callback",
+                extra={"identifier": self.identifier, "url": self.callback_url},
+            )
+            outbox.enqueue(self.callback_url, params)
+
+
+webhook_events = TTLCache(
+    maxsize=settings.WEBHOOK_DEDUP_SIZE, ttl=settings.WEBHOOK_DEDUP_TTL
+)
+
+
+def webhook_event_key(identifier, payload) -> typing.Optional[tuple]:
+    """Key identifying one provider event, from its parsed body: Stripe's
+    event id, or the event type plus the transaction id/reference for
+    Flutterwave and Paystack."""
+    if not isinstance(payload, dict):
+        return None
+    if payload.get("id"):
+        return (identifier, payload["id"])
+    data = payload.get("data")
+    if not isinstance(data, dict):
+        return None
+    reference = data.get("id") or data.get("tx_ref") or data.get("reference")
+    if reference is None:
+        return None
+    return (identifier, payload.get("event"), reference)
+
+
+credential_backend = credentials.get_backend()
+
+credential_cache = TTLCache(
+    maxsize=settings.CREDENTIAL_CACHE_SIZE, ttl=settings.CREDENTIAL_CACHE_TTL
+)
+# Identifiers no backend knew, so junk traffic does not reach the sheet.
+unknown_tenants = TTLCache(
+    maxsize=settings.UNKNOWN_TENANT_CACHE_SIZE, ttl=settings.UNKNOWN_TENANT_TTL
+)
+
+
+def tenant_known(_id) -> bool:
+    """Cheap check that ``_id`` may be a tenant, without any remote lookup.
+
+    Backends that hold every tenant answer from their index; otherwise only
+    identifiers that recently failed a lookup are rejected."""
+    if not _id:
+        return False
+    known = credential_backend.knows(_id)
+    if known is not None:
+        return known
+    return _id not in unknown_tenants
+
+
+async def get_tenant(_id) -> typing.Optional[TenantRecord]:
+    def fetch(backend):
+        started = time.perf_counter()
+        row = backend.get(_id)
+        tenant = TenantRecord.from_row(row) if row else None
+        metrics.credential_lookup_duration.observe(
+            time.perf_counter() - started,
+            backend=backend.name,
+            kind=tenant.kind if tenant else "none",
+        )
+        return tenant
+
+    async def load():
+        backend = credential_backend
+        while backend is not None:
+            if backend.local:
+                tenant = fetch(backend)
+            else:
+                tenant = await loop_helper(lambda: fetch(backend))
+            if tenant is not None:
+                return tenant
+            backend = backend.fallback
+        unknown_tenants.set(_id, True)
+        return None
+
+    if credential_backend.knows(_id) is not True and _id in unknown_tenants:
+        metrics.credential_lookups.inc(result="unknown")
+        return None
+    if _id in credential_cache:
+        metrics.credential_lookups.inc(result="hit")
+    else:
+        metrics.credential_lookups.inc(result="miss")
+    return await credential_cache.get_or_fetch(_id, load)
+
+
+async def post(_id):
+    tenant = await get_tenant(_id)
+    if tenant:
+        return dict(tenant.row)
+
+
+async def build_payment_instance(_id) -> typing.Optional[PaymentInstance]:
+    tenant = await get_tenant(_id)
+    if tenant:
+        metrics.current_kind.set(tenant.kind)
+        return PaymentInstance(tenant)
@@ -1,8 +1,97 @@
-from starlette.config import Config
-from starlette.datastructures import Secret, URL
-
-config = Config(".env")
-DEBUG = config("DEBUG", cast=bool, default=True)
-PAYMENT_SHEET = config("PAYMENT_SHEET")
-NOW_SHEET_SERVICE = config("NOW_SHEET_SERVICE")
-HOST_URL = config("HOST_URL", default="http://localhost:8000")
\ No newline at end of file
+from starlette.config import Config
+from starlette.datastructures import Secret, URL
+
+config = Config(".env")
+DEBUG = config("DEBUG", cast=bool, default=True)
+PAYMENT_SHEET = config("PAYMENT_SHEET")
+NOW_SHEET_SERVICE = config("NOW_SHEET_SERVICE")
+HOST_URL = config("HOST_URL", default="http://localhost:8000")
+PAYSTACK_BASE_URL = config("PAYSTACK_BASE_URL", default="https://api.paystack.co")
+FLUTTERWAVE_BASE_URL = config(
+    "FLUTTERWAVE_BASE_URL", default="https://api.flutterwave.com/v3"
+)
+STRIPE_API_BASE = config("STRIPE_API_BASE", default="https://api.stripe.com")
+
+LOG_LEVEL = config("LOG_LEVEL", default="INFO")
+# Fraction of records kept per level, e.g. "DEBUG=0.1,INFO=1".
+LOG_SAMPLE_RATES = config("LOG_SAMPLE_RATES", default="DEBUG=0.1")
+LOG_QUEUE_SIZE = config("LOG_QUEUE_SIZE", cast=int, default=10000)
+
+# "sheet" reads every lookup from PAYMENT_SHEET through NOW_SHEET_SERVICE,
+# "sqlite" reads a local copy imported with
+# `python -m payments_service.credentials import-sheet` and "snapshot" loads
+# the whole sheet at startup and refreshes it every
+# CREDENTIAL_REFRESH_INTERVAL seconds. "shared" keeps that snapshot in
+# CREDENTIAL_SNAPSHOT_PATH for every worker on the host, which reload it
+# every CREDENTIAL_SNAPSHOT_POLL seconds.
+CREDENTIAL_BACKEND = config("CREDENTIAL_BACKEND", default="sheet")
+CREDENTIAL_DB_PATH = config(
+    "CREDENTIAL_DB_PATH", default="~/.now-payments/credentials.sqlite3"
+)
+CREDENTIAL_REFRESH_INTERVAL = config(
+    "CREDENTIAL_REFRESH_INTERVAL", cast=float, default=300
+)
+CREDENTIAL_SNAPSHOT_PATH = config(
+    "CREDENTIAL_SNAPSHOT_PATH", default="/tmp/now-payments-credentials.json"
+)
+CREDENTIAL_SNAPSHOT_POLL = config("CREDENTIAL_SNAPSHOT_POLL", cast=float, default=5)
+CREDENTIAL_CACHE_TTL = config("CREDENTIAL_CACHE_TTL", cast=float, default=60)
+CREDENTIAL_CACHE_SIZE = config("CREDENTIAL_CACHE_SIZE", cast=int, default=512)
+# Identifiers the backend did not know are not looked up again for this long.
+UNKNOWN_TENANT_TTL = config("UNKNOWN_TENANT_TTL", cast=float, default=60)
+UNKNOWN_TENANT_CACHE_SIZE = config("UNKNOWN_TENANT_CACHE_SIZE", cast=int, default=10000)
+
+HTTP_CONNECT_TIMEOUT = config("HTTP_CONNECT_TIMEOUT", cast=float, default=3.05)
+HTTP_READ_TIMEOUT = config("HTTP_READ_TIMEOUT", cast=float, default=30)
+HTTP_POOL_HOSTS = config("HTTP_POOL_HOSTS", cast=int, default=10)
+HTTP_POOL_SIZE_PER_HOST = config("HTTP_POOL_SIZE_PER_HOST", cast=int, default=20)
+HTTP_DNS_CACHE_TTL = config("HTTP_DNS_CACHE_TTL", cast=float, default=300)
+# Read timeouts shrink to HTTP_TIMEOUT_MULTIPLIER x the host's recent p99
+# latency, but never below HTTP_MIN_READ_TIMEOUT or above HTTP_READ_TIMEOUT.
+HTTP_MIN_READ_TIMEOUT = config("HTTP_MIN_READ_TIMEOUT", cast=float, default=2)
+HTTP_TIMEOUT_MULTIPLIER = config("HTTP_TIMEOUT_MULTIPLIER", cast=float, default=4)
+CIRCUIT_WINDOW = config("CIRCUIT_WINDOW", cast=float, default=30)
+CIRCUIT_MIN_CALLS = config("CIRCUIT_MIN_CALLS", cast=int, default=20)
+CIRCUIT_FAILURE_RATIO = config("CIRCUIT_FAILURE_RATIO", cast=float, default=0.5)
+CIRCUIT_OPEN_FOR = config("CIRCUIT_OPEN_FOR", cast=float, default=15)
+# Send a second copy of idempotent provider reads that take longer than the
+# host's p95, for at most HEDGE_BUDGET of requests.
+HEDGE_REQUESTS = config("HEDGE_REQUESTS", cast=bool, default=False)
+HEDGE_BUDGET = config("HEDGE_BUDGET", cast=float, default=0.05)
+HEDGE_MIN_DELAY = config("HEDGE_MIN_DELAY", cast=float, default=0.05)
+HEDGE_THREADS = config("HEDGE_THREADS", cast=int, default=32)
+
+# Requests per second each tenant may make to each route, with bursts of up to
+# RATE_LIMIT_BURST seconds' worth. Tenants override the rate with the
+# `rate_limit` and `rate_limit_burst` sheet columns. 0, the default, leaves
+# routes and tenants without a limit of their own unlimited.
+RATE_LIMIT = config("RATE_LIMIT", cast=float, default=0)
+RATE_LIMIT_BURST = config("RATE_LIMIT_BURST", cast=float, default=2)
+# Per-route default rates, e.g. "verify_payments=1,build_payment_info=5".
+RATE_LIMIT_ROUTES = config("RATE_LIMIT_ROUTES", default="")
+RATE_LIMIT_SIZE = config("RATE_LIMIT_SIZE", cast=int, default=10000)
+
+OUTBOX_PATH = config("OUTBOX_PATH", default="/tmp/now-payments-outbox.sqlite3")
+OUTBOX_CONCURRENCY = config("OUTBOX_CONCURRENCY", cast=int, default=50)
+OUTBOX_PER_DESTINATION = config("OUTBOX_PER_DESTINATION", cast=int, default=4)
+OUTBOX_MAX_ATTEMPTS = config("OUTBOX_MAX_ATTEMPTS", cast=int, default=8)
+OUTBOX_BASE_DELAY = config("OUTBOX_BASE_DELAY", cast=float, default=2)
+OUTBOX_MAX_DELAY = config("OUTBOX_MAX_DELAY", cast=float, default=600)
+
+WEBHOOK_DEDUP_TTL = config("WEBHOOK_DEDUP_TTL", cast=float, default=3 * 24 * 60 * 60)
+WEBHOOK_DEDUP_SIZE = config("WEBHOOK_DEDUP_SIZE", cast=int, default=50000)
+
+STRIPE_SUBSCRIPTION_CACHE_TTL = config(
+    "STRIPE_SUBSCRIPTION_CACHE_TTL", cast=float, default=300
+)
+STRIPE_SUBSCRIPTION_CACHE_SIZE = config(
+    "STRIPE_SUBSCRIPTION_CACHE_SIZE", cast=int, default=10000
+)
+STRIPE_WEBHOOK_CACHE_TTL = config("STRIPE_WEBHOOK_CACHE_TTL", cast=float, default=300)
+STRIPE_PROVISION_WORKERS = config("STRIPE_PROVISION_WORKERS", cast=int, default=8)
+
+BATCH_VERIFY_CONCURRENCY = config("BATCH_VERIFY_CONCURRENCY", cast=int, default=20)
+BATCH_VERIFY_MAX_ITEMS = config("BATCH_VERIFY_MAX_ITEMS", cast=int, default=500)
+
+VERIFICATION_CACHE_TTL = config("VERIFICATION_CACHE_TTL", cast=float, default=600)
+VERIFICATION_CACHE_SIZE = config("VERIFICATION_CACHE_SIZE", cast=int, default=10000)
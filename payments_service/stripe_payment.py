@@ -1,6 +1,41 @@
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import stripe
-from typing import List, Dict, Optional, Any, TypedDict
+from typing import Iterable, List, Dict, Optional, Any, Tuple, TypedDict
 from datetime import datetime
+from urllib.parse import urlsplit
+
+from payments_service import breaker
+from payments_service import fastjson
+from payments_service import log
+from payments_service import settings
+from payments_service import transport
+from payments_service.cache import TTLCache
+from payments_service.tenants import TenantRecord
+from payments_service.transport import AsyncAdapterMixin
+
+STRIPE_API_VERSION = "2022-11-15"
+STRIPE_HOST = urlsplit(settings.STRIPE_API_BASE).netloc
+
+logger = log.get_logger(__name__)
+
+# (tenant id, subscription id) -> subscription fields used by the webhook and
+# verify paths; kept fresh by customer.subscription.* events.
+subscription_cache = TTLCache(
+    maxsize=settings.STRIPE_SUBSCRIPTION_CACHE_SIZE,
+    ttl=settings.STRIPE_SUBSCRIPTION_CACHE_TTL,
+)
+# tenant id -> that tenant's webhook endpoints, kept current by create_webhook.
+webhook_endpoint_cache = TTLCache(maxsize=1024, ttl=settings.STRIPE_WEBHOOK_CACHE_TTL)
+
+PRICE_RECURRENCE = {
+    30: {"interval": "day", "interval_count": 30},
+    90: {"interval": "day", "interval_count": 90},
+    180: {"interval": "day", "interval_count": 180},
+    365: {"interval": "day", "interval_count": 365},
+}
 
 
 class PlanType(TypedDict):
@@ -22,113 +57,302 @@ class PaymentJSONType(TypedDict):
     metadata: Optional[Dict[str, str]]
 
 
+def plan_key(name: str, currency: str, duration: int) -> Tuple[str, str, int]:
+    return (name.lower(), currency.lower(), int(duration))
+
+
+def idempotency_key(*parts: Any) -> str:
+    """Stable Stripe idempotency key for a write, so a retried provisioning
+    run gets the original object back instead of a duplicate."""
+    digest = hashlib.sha256("\x1f".join(str(part) for part in parts).encode())
+    return f"now-payments-{digest.hexdigest()[:40]}"
+
+
+def get_duration(recurring: Dict[str, Any]) -> int:
+    if recurring["interval"] == "day":
+        return recurring["interval_count"]
+    if recurring["interval"] == "month":
+        return recurring["interval_count"] * 30
+    if recurring["interval"] == "year":
+        return recurring["interval_count"] * 365
+    return 0
+
+
+class HTTPClient(stripe.RequestsClient):
+    """Lets ``CircuitOpenError`` from our session through unwrapped. stripe
+    raises every session error as an ``APIConnectionError`` chained to it,
+    which would hide it from the 503 handler."""
+
+    def request(self, method, url, headers, post_data=None):
+        try:
+            return super().request(method, url, headers, post_data)
+        except stripe.APIConnectionError as err:
+            if isinstance(err.__cause__, breaker.CircuitOpenError):
+                raise err.__cause__ from None
+            raise
+
+
+class StripeCatalog:
+    """A tenant's full Stripe product/price catalog, indexed by product id,
+    lowercase product name and ``(name, currency, duration)``."""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.products: List[Dict[str, str]] = []
+        self.plans: List[PlanType] = []
+        self.products_by_id: Dict[str, Dict[str, str]] = {}
+        self.products_by_name: Dict[str, Dict[str, str]] = {}
+        self.plans_by_name: Dict[str, PlanType] = {}
+        self.plans_by_key: Dict[Tuple[str, str, int], PlanType] = {}
+
+    def load(self, products: Iterable[Any], prices: Iterable[Any]):
+        self.clear()
+        for product in products:
+            self.add_product({"id": product["id"], "name": product["name"]})
+        for price in prices:
+            product = self.products_by_id.get(price["product"])
+            if (
+                product is None
+                or not price["active"]
+                or not price["recurring"]
+                or not str(price["unit_amount"]).endswith("00")
+            ):
+                continue
+            self.add_plan(
+                {
+                    "id": price["id"],
+                    "name": product["name"],
+                    "amount": price["unit_amount"],
+                    "duration": get_duration(price["recurring"]),
+                    "currency": price["currency"],
+                }
+            )
+        return self
+
+    def add_product(self, product: Dict[str, str]):
+        self.products.append(product)
+        self.products_by_id[product["id"]] = product
+        self.products_by_name.setdefault(product["name"].lower(), product)
+
+    def add_plan(self, plan: PlanType, replace: bool = False):
+        # Stripe lists newest first, so the first plan seen for a key wins
+        # unless it is being replaced by a freshly created price.
+        self.plans.append(plan)
+        key = plan_key(plan["name"], plan["currency"], plan["duration"])
+        if replace:
+            self.plans_by_name[plan["name"].lower()] = plan
+            self.plans_by_key[key] = plan
+        else:
+            self.plans_by_name.setdefault(plan["name"].lower(), plan)
+            self.plans_by_key.setdefault(key, plan)
+
+    def product(self, name: str) -> Optional[Dict[str, str]]:
+        return self.products_by_name.get(name.lower())
+
+    def plan(
+        self, name: str, currency: Optional[str] = None, duration: Optional[int] = None
+    ) -> Optional[PlanType]:
+        if currency is None or duration is None:
+            return self.plans_by_name.get(name.lower())
+        return self.plans_by_key.get(plan_key(name, currency, duration))
+
+
 class StripeProcessor:
     def __init__(self, secret_key: str, id: str, public_key: str):
         self.secret_key = secret_key
         self.public_key = public_key
         self.id = id
-        self.plans: List[PlanType] = []
-        self.products: List[Dict[str, str]] = []
-        stripe.api_key = self.secret_key
-        stripe.api_version = "2022-11-15"
+        self.catalog = StripeCatalog()
+        self._catalog_lock = threading.Lock()
+        # Each tenant talks to Stripe through its own client and connection
+        # pool instead of the module-level ``stripe.api_key``, so calls for
+        # different tenants can safely run concurrently.
+        self.client = stripe.StripeClient(
+            secret_key,
+            stripe_version=STRIPE_API_VERSION,
+            base_addresses={"api": settings.STRIPE_API_BASE},
+            http_client=HTTPClient(
+                timeout=transport.default_timeout(),
+                session=transport.build_session(),
+            ),
+        )
 
-    def get_plan(self, name: str) -> Optional[PlanType]:
-        return next(
-            (plan for plan in self.plans if plan["name"].lower() == name.lower()), None
+    @property
+    def plans(self) -> List[PlanType]:
+        return self.catalog.plans
+
+    @property
+    def products(self) -> List[Dict[str, str]]:
+        return self.catalog.products
+
+    def cache_subscription(self, subscription: Dict[str, Any]) -> Dict[str, Any]:
+        fields = (
+            "id",
+            "status",
+            "currency",
+            "current_period_start",
+            "current_period_end",
         )
+        snapshot = {field: subscription.get(field) for field in fields}
+        subscription_cache.set((self.id, snapshot["id"]), snapshot)
+        return snapshot
+
+    def get_subscription(self, subscription_id: str) -> Dict[str, Any]:
+        subscription = subscription_cache.get((self.id, subscription_id))
+        if subscription is None:
+            subscription = self.cache_subscription(
+                self.client.subscriptions.retrieve(subscription_id)
+            )
+        return subscription
+
+    def get_plan(self, name: str) -> Optional[PlanType]:
+        return self.catalog.plan(name)
 
     def create_product(self, name: str):
-        existing_product = next(
-            (
-                product
-                for product in self.products
-                if product["name"].lower() == name.lower()
-            ),
-            None,
-        )
+        with self._catalog_lock:
+            existing_product = self.catalog.product(name)
         if existing_product:
             return existing_product
-        response = stripe.Product.create(name=name)
-        return response
-
-    def create_price(self, plan: Dict[str, Any], update: bool = False):
-        options = {
-            30: {"interval": "day", "interval_count": 30},
-            90: {"interval": "day", "interval_count": 90},
-            180: {"interval": "day", "interval_count": 180},
-            365: {"interval": "day", "interval_count": 365},
-        }
+        response = self.client.products.create(
+            params={"name": name},
+            options={"idempotency_key": idempotency_key(self.id, "product", name)},
+        )
+        product = {"id": response.id, "name": response.name}
+        with self._catalog_lock:
+            # A concurrent call may have added it while this one was waiting.
+            existing_product = self.catalog.product(name)
+            if existing_product:
+                return existing_product
+            self.catalog.add_product(product)
+        return product
+
+    def provision_price(self, plan: Dict[str, Any], update: bool = False):
+        """Create the price for ``plan`` unless an equivalent one exists.
+        Returns ``("exists" | "created" | "updated", plan)``."""
+        amount = int(plan["amount"] * 100)
         product = self.create_product(plan["name"])
-        existing_plan = self.get_plan(plan["name"])
+        with self._catalog_lock:
+            existing_plan = self.catalog.plan(
+                plan["name"], plan["currency"], plan["duration"]
+            )
         if existing_plan:
-            if update and existing_plan["amount"] != int(plan["amount"] * 100):
-                response = stripe.Price.create(
-                    currency=plan["currency"].lower(),
-                    recurring=options[plan["duration"]],
-                    unit_amount=int(plan["amount"] * 100),
-                    product=product.id,
+            if not update or existing_plan["amount"] == amount:
+                return "exists", existing_plan
+        response = self.client.prices.create(
+            params={
+                "currency": plan["currency"].lower(),
+                "recurring": PRICE_RECURRENCE[plan["duration"]],
+                "unit_amount": amount,
+                "product": product["id"],
+            },
+            options={
+                "idempotency_key": idempotency_key(
+                    self.id,
+                    "price",
+                    product["id"],
+                    plan["currency"].lower(),
+                    plan["duration"],
+                    amount,
                 )
-                stripe.Product.modify(product.id, default_price=response.id)
-                return {
-                    "id": response.id,
-                    "name": product.name,
-                    "amount": response.unit_amount,
-                    "duration": self.get_duration(response.recurring),
-                    "currency": response.currency,
-                }
-            return existing_plan
-        response = stripe.Price.create(
-            currency=plan["currency"].lower(),
-            recurring=options[plan["duration"]],
-            unit_amount=int(plan["amount"] * 100),
-            product=product.id,
+            },
         )
-        return {
+        if existing_plan:
+            self.client.products.update(
+                product["id"], params={"default_price": response.id}
+            )
+        created = {
             "id": response.id,
-            "name": product.name,
+            "name": product["name"],
             "amount": response.unit_amount,
             "duration": self.get_duration(response.recurring),
             "currency": response.currency,
         }
+        with self._catalog_lock:
+            self.catalog.add_plan(created, replace=True)
+        return ("updated" if existing_plan else "created"), created
+
+    def create_price(self, plan: Dict[str, Any], update: bool = False):
+        return self.provision_price(plan, update)[1]
 
     def get_duration(self, recurring: Dict[str, Any]) -> int:
-        if recurring["interval"] == "day":
-            return recurring["interval_count"]
-        if recurring["interval"] == "month":
-            return recurring["interval_count"] * 30
-        if recurring["interval"] == "year":
-            return recurring["interval_count"] * 365
-        return 0
+        return get_duration(recurring)
 
     def get_prices(self):
-        prices = stripe.Price.list(limit=100)
-        products = stripe.Product.list(limit=100)
-        self.products = [
-            {"id": product.id, "name": product.name} for product in products.data
-        ]
-        self.plans = [
-            {
-                "id": price.id,
-                "name": next(
-                    product["name"]
-                    for product in self.products
-                    if product["id"] == price.product
-                ),
-                "amount": price.unit_amount,
-                "duration": self.get_duration(price.recurring),
-                "currency": price.currency,
-            }
-            for price in prices.data
-            if price.active
-            and price.recurring
-            and str(price.unit_amount).endswith("00")
-        ]
+        products = self.client.products.list(params={"limit": 100})
+        prices = self.client.prices.list(params={"limit": 100})
+        self.catalog.load(products.auto_paging_iter(), prices.auto_paging_iter())
         return self.plans
 
     def create_prices(self, plans: List[Dict[str, Any]], update: bool = False):
+        report = self.provision(plans, update)
+        for item in report:
+            if item["status"] == "failed":
+                raise ValueError(f"Could not create {item['name']}: {item['error']}")
+        return [item["plan"] for item in report]
+
+    def provision(
+        self,
+        plans: List[Dict[str, Any]],
+        update: bool = False,
+        workers: Optional[int] = None,
+    ) -> List[Dict[str, Any]]:
+        """Create the products and prices for ``plans`` on a bounded pool of
+        workers and report what happened to each plan, in order.
+
+        Writes carry deterministic idempotency keys, so re-running a
+        provisioning that failed halfway does not create duplicates."""
         self.get_prices()
-        response = [self.create_price(plan, update) for plan in plans]
-        return response
+        workers = workers or settings.STRIPE_PROVISION_WORKERS
+
+        def provision_plan(plan):
+            try:
+                status, created = self.provision_price(plan, update)
+            except Exception as err:
+                return {
+                    "name": plan["name"],
+                    "status": "failed",
+                    "plan": None,
+                    "error": str(err),
+                }
+            return {
+                "name": plan["name"],
+                "status": status,
+                "plan": created,
+                "error": None,
+            }
+
+        def price_key(plan):
+            key = plan_key(plan["name"], plan["currency"], plan["duration"])
+            return (*key, int(plan["amount"] * 100))
+
+        # Identical plans would send the same idempotency key concurrently,
+        # which Stripe rejects, so each one is provisioned once.
+        unique = {price_key(plan): plan for plan in plans}
+        with ThreadPoolExecutor(max(1, min(workers, len(unique)))) as pool:
+            # Products first, so plans sharing a name share one product.
+            names = list(
+                {plan["name"].lower(): plan["name"] for plan in plans}.values()
+            )
+            list(pool.map(self._ensure_product, names))
+            report = dict(zip(unique, pool.map(provision_plan, unique.values())))
+        return [
+            {
+                "currency": plan["currency"],
+                "duration": plan["duration"],
+                "amount": plan["amount"],
+                **report[price_key(plan)],
+            }
+            for plan in plans
+        ]
+
+    def _ensure_product(self, name: str):
+        # Failures surface again, per plan, in provision_price.
+        try:
+            self.create_product(name)
+        except Exception:
+            pass
 
     def build_session_url(
         self, payload: Dict[str, Any], mode: str = "subscription", currency: str = "usd"
@@ -147,15 +371,17 @@ class StripeProcessor:
                     "quantity": 1,
                 }
             )
-        session = stripe.checkout.Session.create(
-            mode=mode,
-            payment_method_types=["card"],
-            line_items=line_items,
-            customer_email=payload["user"]["email"],
-            client_reference_id=payload.get("session_id"),
-            success_url=payload["success_url"],
-            cancel_url=payload["cancel_url"],
-            metadata=payload.get("metadata"),
+        session = self.client.checkout.sessions.create(
+            params={
+                "mode": mode,
+                "payment_method_types": ["card"],
+                "line_items": line_items,
+                "customer_email": payload["user"]["email"],
+                "client_reference_id": payload.get("session_id"),
+                "success_url": payload["success_url"],
+                "cancel_url": payload["cancel_url"],
+                "metadata": payload.get("metadata"),
+            }
         )
         return {
             "url": session.url,
@@ -166,21 +392,27 @@ class StripeProcessor:
         }
 
     def build_session_ui_url(self, currency="usd", **payload):
-        session = stripe.checkout.Session.create(
-            ui_mode="embedded",
-            line_items=[
-                {
-                    # Provide the exact Price ID (for example, pr_1234) of the product you want to sell
-                    "price_data": {
-                        "currency": currency.lower(),
-                        "unit_amount": int(payload["amount"] * 100),
-                        "product_data": {"name": payload.get('title') or payload.get('description')},
+        session = self.client.checkout.sessions.create(
+            params={
+                "ui_mode": "embedded",
+                "line_items": [
+                    {
+                        # Provide the exact Price ID (for example, pr_1234) of the product you want to sell
+                        "price_data": {
+                            "currency": currency.lower(),
+                            "unit_amount": int(payload["amount"] * 100),
+                            "product_data": {
+                                "name": payload.get("title")
+                                or payload.get("description")
+                            },
+                        },
+                        "quantity": 1,
                     },
-                    "quantity": 1,
-                },
-            ],
-            mode="payment",
-            return_url=payload["return_url"] + "?session_id={CHECKOUT_SESSION_ID}",
+                ],
+                "mode": "payment",
+                "return_url": payload["return_url"]
+                + "?session_id={CHECKOUT_SESSION_ID}",
+            }
         )
         return {
             "session_secret": session.client_secret,
@@ -190,11 +422,14 @@ class StripeProcessor:
 
     def verify_successful_session(self, payload: Dict[str, str]):
         try:
-            session = stripe.checkout.Session.retrieve(payload["session_id"])
+            session = transport.hedged_call(
+                STRIPE_HOST,
+                self.client.checkout.sessions.retrieve,
+                payload["session_id"],
+            )
         except Exception:
-            sessions = stripe.checkout.Session.list(
-                limit=100,
-                subscription=payload["session_id"],
+            sessions = self.client.checkout.sessions.list(
+                params={"limit": 100, "subscription": payload["session_id"]}
             )
             completed_sessions = [s for s in sessions.data if s.status == "complete"]
             if completed_sessions:
@@ -204,20 +439,22 @@ class StripeProcessor:
 
         subscription = {}
         if session.subscription:
-            found_subscription = stripe.Subscription.retrieve(session.subscription)
+            found_subscription = self.get_subscription(session.subscription)
             subscription = {
-                "subscription": found_subscription.id,
+                "subscription": found_subscription["id"],
                 "next_payment_date": datetime.fromtimestamp(
-                    found_subscription.current_period_end
+                    found_subscription["current_period_end"]
                 ).isoformat(),
                 "start_date": datetime.fromtimestamp(
-                    found_subscription.current_period_start
+                    found_subscription["current_period_start"]
                 ).isoformat(),
-                "currency": found_subscription.currency,
+                "currency": found_subscription["currency"],
             }
 
+        amount_total = getattr(session, "amount_total", None)
         return {
             "status": "success" if session.status == "complete" else "failed",
+            "amount": amount_total / 100 if amount_total is not None else None,
             "authorization": None,
             **subscription,
             "customer": session.customer,
@@ -225,36 +462,41 @@ class StripeProcessor:
 
     def build_customer_portal_url(self, payload: Dict[str, str]):
         if payload.get("customer_code"):
-            portal_session = stripe.billing_portal.Session.create(
-                customer=payload["customer_code"],
-                return_url=payload["return_url"],
+            portal_session = self.client.billing_portal.sessions.create(
+                params={
+                    "customer": payload["customer_code"],
+                    "return_url": payload["return_url"],
+                }
             )
             return portal_session
 
         status, customer = self.verify_successful_session(payload)
         if status:
-            portal_session = stripe.billing_portal.Session.create(
-                customer=customer,
-                return_url=payload["return_url"],
+            portal_session = self.client.billing_portal.sessions.create(
+                params={"customer": customer, "return_url": payload["return_url"]}
             )
             return portal_session
 
     def construct_event(self, payload: Dict[str, Any]):
+        event = payload["body"]
         if payload.get("webhook_secret") and payload.get("sig"):
             try:
-                event = stripe.Webhook.construct_event(
-                    payload["body"], payload["sig"], payload["webhook_secret"]
+                # The signature covers the raw body; once it checks out the
+                # body is parsed once (or not at all if the caller already
+                # did) instead of being turned into a stripe.Event.
+                stripe.WebhookSignature.verify_header(
+                    event, payload["sig"], payload["webhook_secret"]
                 )
+                event = payload.get("event") or fastjson.loads(event)
             except Exception as err:
                 raise ValueError(f"Webhook Error: {str(err)}")
-            data = event["data"]
-            event_type = event["type"]
-        else:
-            data = payload["body"]["data"]
-            event_type = payload["body"]["type"]
+        data = event["data"]
+        event_type = event["type"]
 
         subscription = None
-        print("type", event_type)
+        logger.info(
+            "stripe webhook event", extra={"identifier": self.id, "event": event_type}
+        )
 
         if event_type == "checkout.session.completed":
             session = data["object"]
@@ -280,7 +522,7 @@ class StripeProcessor:
         elif event_type == "invoice.paid":
             invoice = data["object"]
             if invoice["subscription"]:
-                rr = stripe.Subscription.retrieve(invoice["subscription"])
+                rr = self.get_subscription(invoice["subscription"])
                 subscription = {
                     "subscription_code": invoice["subscription"],
                     "next_payment_date": datetime.fromtimestamp(
@@ -316,6 +558,7 @@ class StripeProcessor:
             }
         elif event_type == "customer.subscription.deleted":
             subscription_deleted = data["object"]
+            self.cache_subscription(subscription_deleted)
             return {
                 "event": "subscription.disable",
                 "data": {
@@ -329,7 +572,7 @@ class StripeProcessor:
         elif event_type == "invoice.payment_failed":
             invoice_failed = data["object"]
             if invoice_failed["subscription"]:
-                rr = stripe.Subscription.retrieve(invoice_failed["subscription"])
+                rr = self.get_subscription(invoice_failed["subscription"])
                 subscription = {
                     "subscription_code": invoice_failed["subscription"],
                     "next_payment_date": datetime.fromtimestamp(
@@ -359,6 +602,12 @@ class StripeProcessor:
                     ).isoformat(),
                 },
             }
+        elif event_type in (
+            "customer.subscription.created",
+            "customer.subscription.updated",
+        ):
+            self.cache_subscription(data["object"])
+            return None
         else:
             return None
 
@@ -385,9 +634,13 @@ class StripeProcessor:
             "user_details": {"kind": "stripe", "paymentLink": session["url"]},
         }
 
-    def get_webhook_list(self):
-        response = stripe.WebhookEndpoint.list(limit=100)
-        return response.data
+    def get_webhook_list(self, refresh: bool = False):
+        webhooks = None if refresh else webhook_endpoint_cache.get(self.id)
+        if webhooks is None:
+            response = self.client.webhook_endpoints.list(params={"limit": 100})
+            webhooks = list(response.auto_paging_iter())
+            webhook_endpoint_cache.set(self.id, webhooks)
+        return webhooks
 
     def create_webhook(self, url: str):
         webhooks = self.get_webhook_list()
@@ -396,23 +649,29 @@ class StripeProcessor:
         )
         if existing_webhook:
             return existing_webhook
-        response = stripe.WebhookEndpoint.create(
-            url=url,
-            enabled_events=[
-                "charge.failed",
-                "charge.succeeded",
-                "checkout.session.completed",
-                "payment_intent.succeeded",
-                "payment_intent.payment_failed",
-            ],
+        response = self.client.webhook_endpoints.create(
+            params={
+                "url": url,
+                "enabled_events": [
+                    "charge.failed",
+                    "charge.succeeded",
+                    "checkout.session.completed",
+                    "payment_intent.succeeded",
+                    "payment_intent.payment_failed",
+                ],
+            },
+            options={"idempotency_key": idempotency_key(self.id, "webhook", url)},
         )
+        webhook_endpoint_cache.set(self.id, webhooks + [response])
         return response
 
 
-class WebhookType(TypedDict):
-    body: Dict[str, str]
+class WebhookType(TypedDict, total=False):
+    body: Any
     sig: Optional[str]
     webhook_secret: Optional[str]
+    # ``body`` already parsed, when the caller has it.
+    event: Dict[str, Any]
 
 
 class Processor:
@@ -431,12 +690,16 @@ class Processor:
     def get_webhook_list(self):
         return self.stripe.get_webhook_list()
 
+    def provision(self, plans: List[Dict[str, Any]], update: bool = False):
+        return self.stripe.provision(plans, update)
+
     def processWebhook(self, payload: WebhookType, callback):
         event = self.stripe.construct_event(
             {
                 "body": payload["body"],
                 "sig": payload["sig"],
                 "webhook_secret": payload["webhook_secret"],
+                "event": payload.get("event"),
             }
         )
         if event and event.get("event") == "checkout.session.completed":
@@ -450,7 +713,7 @@ class Processor:
         return self.stripe.build_session_ui_url(**kwargs)
 
 
-class StripeAPI:
+class StripeAPI(AsyncAdapterMixin):
     def __init__(self, django=True, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
@@ -465,7 +728,7 @@ class StripeAPI:
             }
         )
         if result["status"] == "success":
-            return True, "Successful"
+            return True, "Successful", result
         return False, "Failed", result, None
 
     def processor_info(self, amount, redirect_url=None, **kwargs):
@@ -479,3 +742,12 @@ class StripeAPI:
 
     def other_payment_info(self, **kwargs):
         return self.transaction_api.build_transaction_obj(**kwargs)
+
+
+def build_stripe(tenant: TenantRecord):
+    return StripeAPI(
+        public_key=tenant.public_key,
+        secret_key=tenant.secret_key,
+        django=False,
+        id=tenant.identifier,
+    )
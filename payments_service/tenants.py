@@ -0,0 +1,89 @@
+import sys
+import typing
+from types import MappingProxyType
+
+
+def _optional_float(value) -> typing.Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+class TenantRecord:
+    """Immutable, parsed view of one row of the payment sheet.
+
+    Rows are parsed once when they are fetched, so the provider kind and the
+    test flag are resolved up front instead of on every request."""
+
+    __slots__ = (
+        "identifier",
+        "kind",
+        "public_key",
+        "secret_key",
+        "test",
+        "webhook_url",
+        "rate_limit",
+        "rate_limit_burst",
+        "row",
+    )
+
+    def __init__(
+        self,
+        identifier: str,
+        kind: str,
+        public_key: typing.Optional[str] = None,
+        secret_key: typing.Optional[str] = None,
+        test: bool = False,
+        webhook_url: typing.Optional[str] = None,
+        rate_limit: typing.Optional[float] = None,
+        rate_limit_burst: typing.Optional[float] = None,
+        row: typing.Optional[typing.Mapping[str, typing.Any]] = None,
+    ):
+        set_attr = object.__setattr__
+        set_attr(self, "identifier", identifier)
+        set_attr(self, "kind", sys.intern(kind) if kind else kind)
+        set_attr(self, "public_key", public_key)
+        set_attr(self, "secret_key", secret_key)
+        set_attr(self, "test", test)
+        set_attr(self, "webhook_url", webhook_url)
+        set_attr(self, "rate_limit", rate_limit)
+        set_attr(self, "rate_limit_burst", rate_limit_burst)
+        set_attr(self, "row", MappingProxyType(dict(row or {})))
+
+    @classmethod
+    def from_row(cls, row: typing.Mapping[str, typing.Any]) -> "TenantRecord":
+        return cls(
+            identifier=row["id"],
+            kind=row["type"],
+            public_key=row.get("public_key"),
+            secret_key=row.get("secret_key"),
+            test=row.get("test") == "TRUE",
+            webhook_url=row.get("webhook_url"),
+            rate_limit=_optional_float(row.get("rate_limit")),
+            rate_limit_burst=_optional_float(row.get("rate_limit_burst")),
+            row=row,
+        )
+
+    @property
+    def credentials(self) -> typing.Tuple[typing.Any, ...]:
+        """Everything an adapter is built from. A cached adapter is only reused
+        while this stays the same."""
+        return (self.kind, self.public_key, self.secret_key, self.test)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("TenantRecord is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("TenantRecord is immutable")
+
+    def __eq__(self, other):
+        if not isinstance(other, TenantRecord):
+            return NotImplemented
+        return self.identifier == other.identifier and self.row == other.row
+
+    def __hash__(self):
+        return hash((self.identifier, self.credentials))
+
+    def __repr__(self):
+        return f"TenantRecord(identifier={self.identifier!r}, kind={self.kind!r})"
@@ -0,0 +1,323 @@
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import socket
+import threading
+import time
+import typing
+import weakref
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import connection as urllib3_connection
+
+from payments_service import breaker
+from payments_service import metrics
+from payments_service import settings
+from payments_service.cache import TTLCache
+
+
+class TimeoutSession(requests.Session):
+    """``requests.Session`` that applies a default ``(connect, read)`` timeout
+    to every request that does not specify its own, shortened to what the
+    host has recently needed, and refuses to call hosts whose circuit breaker
+    is open."""
+
+    def __init__(self, timeout: typing.Tuple[float, float]):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        host = urlsplit(url).netloc
+        health = breaker.host_health(host)
+        health.check()
+        kwargs["timeout"] = health.timeout(kwargs.get("timeout", self.timeout))
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = super().request(method, url, **kwargs)
+            status = response.status_code
+            return response
+        finally:
+            record_outcome(health, method, host, status, started)
+
+
+def record_outcome(health, method, host, status, started):
+    failed = status == "error" or status >= 500
+    health.record(failed, time.perf_counter() - started)
+    metrics.observe_outbound(method, host, status, started)
+
+
+def default_timeout() -> typing.Tuple[float, float]:
+    return (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT)
+
+
+def build_session() -> requests.Session:
+    session = TimeoutSession(default_timeout())
+    adapter = HTTPAdapter(
+        pool_connections=settings.HTTP_POOL_HOSTS,
+        pool_maxsize=settings.HTTP_POOL_SIZE_PER_HOST,
+        pool_block=True,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+_session: typing.Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """The process-wide pooled session used for every outbound call."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                if settings.HTTP_DNS_CACHE_TTL > 0:
+                    install_dns_cache(settings.HTTP_DNS_CACHE_TTL)
+                _session = build_session()
+    return _session
+
+
+def request(method: str, url: str, hedge: bool = False, **kwargs) -> requests.Response:
+    """Make a call through the pooled session. ``hedge`` marks idempotent
+    reads that may be sent twice, see ``hedged_call``."""
+    if hedge:
+        return hedged_call(
+            urlsplit(url).netloc, get_session().request, method, url, **kwargs
+        )
+    return get_session().request(method, url, **kwargs)
+
+
+_async_sessions: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_host_limits: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+
+
+def get_async_session():
+    """The pooled ``requests_async`` session for the running event loop."""
+    import requests_async
+
+    loop = asyncio.get_event_loop()
+    session = _async_sessions.get(loop)
+    if session is None:
+        session = _async_sessions[loop] = requests_async.Session()
+    return session
+
+
+def _host_limit(url: str) -> asyncio.Semaphore:
+    loop = asyncio.get_event_loop()
+    limits = _host_limits.setdefault(loop, {})
+    host = urlsplit(url).netloc
+    if host not in limits:
+        limits[host] = asyncio.Semaphore(settings.HTTP_POOL_SIZE_PER_HOST)
+    return limits[host]
+
+
+async def async_request(method: str, url: str, hedge: bool = False, **kwargs):
+    if hedge:
+        return await hedged_request(method, url, **kwargs)
+    host = urlsplit(url).netloc
+    health = breaker.host_health(host)
+    kwargs["timeout"] = health.timeout(kwargs.get("timeout", default_timeout()))
+    async with _host_limit(url):
+        # Checked once a slot is free, so a call that is cancelled while
+        # queued never holds the half-open probe.
+        probe = health.check()
+        started = time.perf_counter()
+        try:
+            response = await get_async_session().request(method, url, **kwargs)
+        except asyncio.CancelledError:
+            # A hedge that lost the race says nothing about the host.
+            if probe:
+                health.release_probe()
+            raise
+        except Exception:
+            record_outcome(health, method, host, "error", started)
+            raise
+        record_outcome(health, method, host, response.status_code, started)
+        return response
+
+
+class HedgeBudget:
+    """Retry-budget style token bucket: every request deposits ``ratio`` of
+    a token and every hedge spends a whole one, so hedges stay below that
+    fraction of requests, with up to ``burst`` saved up."""
+
+    def __init__(self, ratio: float, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self._lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+hedge_budget = HedgeBudget(settings.HEDGE_BUDGET)
+hedges = metrics.registry.counter(
+    "payments_hedged_requests_total",
+    "Hedged reads sent to a host, and how many of them answered first.",
+    ("host", "result"),
+)
+_hedge_pool = concurrent.futures.ThreadPoolExecutor(
+    settings.HEDGE_THREADS, thread_name_prefix="hedge"
+)
+
+
+def hedge_delay(host: str) -> typing.Optional[float]:
+    """How long to wait for a read before hedging it: the host's running
+    p95. ``None`` disables hedging."""
+    if not settings.HEDGE_REQUESTS:
+        return None
+    p95 = breaker.host_health(host).percentile(0.95)
+    if p95 is None:
+        return None
+    return max(p95, settings.HEDGE_MIN_DELAY)
+
+
+async def hedged_request(method: str, url: str, **kwargs):
+    """``async_request`` for idempotent reads. When the first attempt takes
+    longer than the host's p95 and the budget allows, a second one is sent
+    and whichever succeeds first is returned."""
+    host = urlsplit(url).netloc
+    hedge_budget.deposit()
+    delay = hedge_delay(host)
+    first = asyncio.ensure_future(async_request(method, url, **kwargs))
+    if delay is None:
+        return await first
+    tasks = [first]
+    try:
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done or not hedge_budget.withdraw():
+            return await first
+        hedges.inc(host=host, result="sent")
+        tasks.append(asyncio.ensure_future(async_request(method, url, **kwargs)))
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    if task is not first:
+                        hedges.inc(host=host, result="won")
+                    return task.result()
+        return first.result()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def hedged_call(host: str, func, *args, **kwargs):
+    """Blocking counterpart of ``hedged_request`` for an idempotent read made
+    by ``func`` against ``host``. A losing attempt cannot be cancelled and
+    finishes in the background."""
+    hedge_budget.deposit()
+    delay = hedge_delay(host)
+    if delay is None:
+        return func(*args, **kwargs)
+
+    def submit():
+        context = contextvars.copy_context()
+        return _hedge_pool.submit(context.run, func, *args, **kwargs)
+
+    first = submit()
+    done, _ = concurrent.futures.wait([first], timeout=delay)
+    if done or not hedge_budget.withdraw():
+        return first.result()
+    hedges.inc(host=host, result="sent")
+    pending = {first, submit()}
+    while pending:
+        done, pending = concurrent.futures.wait(
+            pending, return_when=concurrent.futures.FIRST_COMPLETED
+        )
+        for future in done:
+            if future.exception() is None:
+                if future is not first:
+                    hedges.inc(host=host, result="won")
+                return future.result()
+    return first.result()
+
+
+async def run_sync(func, *args, **kwargs):
+    """Run a blocking call on the default executor so it does not stall the
+    event loop. Context variables are carried over to the worker thread."""
+    loop = asyncio.get_event_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        None, functools.partial(context.run, func, *args, **kwargs)
+    )
+
+
+class AsyncAdapterMixin:
+    """Async API shared by the provider adapters. Adapters backed by a
+    synchronous client inherit these defaults, which run the blocking call on
+    the executor; adapters with a native async client override them."""
+
+    async def async_verify_payment(self, code, **kwargs):
+        return await run_sync(self.verify_payment, code, **kwargs)
+
+    async def async_other_payment_info(self, **kwargs):
+        return await run_sync(self.other_payment_info, **kwargs)
+
+    async def async_create_payment_account(self, *args, **kwargs):
+        return await run_sync(
+            self.transaction_api.create_payment_account, *args, **kwargs
+        )
+
+    async def async_verify_webhook(self, signature, body, payload, **kwargs):
+        """Verify a webhook and send its signal. ``payload`` is ``body``
+        already parsed; provider libraries that only take the raw body
+        ignore it."""
+        return await run_sync(self.webhook_api.verify, signature, body, **kwargs)
+
+
+_dns_cache: typing.Optional[TTLCache] = None
+_dns_lock = threading.Lock()
+_create_connection = urllib3_connection.create_connection
+
+
+def _resolve(host, port):
+    key = (host, port)
+    with _dns_lock:
+        addresses = _dns_cache.get(key)
+    if addresses is None:
+        addresses = socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+        with _dns_lock:
+            _dns_cache.set(key, addresses)
+    return addresses
+
+
+def _cached_create_connection(address, *args, **kwargs):
+    host, port = address
+    try:
+        addresses = _resolve(host, port)
+    except OSError:
+        return _create_connection(address, *args, **kwargs)
+    for *_, sockaddr in addresses:
+        try:
+            return _create_connection((sockaddr[0], port), *args, **kwargs)
+        except OSError:
+            continue
+    with _dns_lock:
+        _dns_cache.pop((host, port))
+    return _create_connection(address, *args, **kwargs)
+
+
+def install_dns_cache(ttl: float):
+    """Resolve each host at most once every ``ttl`` seconds for new pooled
+    connections. TLS still verifies against the original hostname."""
+    global _dns_cache
+    _dns_cache = TTLCache(maxsize=256, ttl=ttl)
+    urllib3_connection.create_connection = _cached_create_connection
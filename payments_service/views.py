@@ -1,46 +1,94 @@
-import typing
-
-from starlette.applications import Starlette
-from starlette.responses import JSONResponse
-from starlette.routing import Route, Mount
-from starlette.requests import Request
-from starlette.middleware import Middleware
-from starlette.background import BackgroundTask
-from starlette.middleware.cors import CORSMiddleware
-from payments_service import service
-from payments_service import ravepay_views
-
-
-def home(request: Request):
-    return JSONResponse({"hello": "world"})
-
-
-middlewares = [
-    Middleware(
-        CORSMiddleware,
-        allow_origins=["*"],
-        allow_headers=["*"],
-        allow_methods=["*"],
-        allow_credentials=True,
-    )
-]
-
-routes = [
-    Route("/", home),
-    # Route("/credentials", payment_credentials),
-    Route("/webhook", ravepay_views.webhook_callback, methods=["POST"]),
-    Route("/verify-payment/{identifier}", ravepay_views.verify_payment),
-    Route(
-        "/generate-account-no/{identifier}",
-        ravepay_views.generate_payment_account_no,
-        methods=["POST"],
-    ),
-    Route(
-        "/build-payment-info/{identifier}",
-        ravepay_views.client_payment_object,
-        methods=["POST"],
-    ),
-    Mount("/ravepay", routes=ravepay_views.routes),
-]
-
-app = Starlette(middleware=middlewares, routes=routes)
+import contextlib
+import math
+import typing
+
+from starlette.applications import Starlette
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route, Mount
+from starlette.requests import Request
+from starlette.middleware import Middleware
+from starlette.background import BackgroundTask
+from starlette.middleware.cors import CORSMiddleware
+from payments_service import breaker
+from payments_service import metrics
+from payments_service import ratelimit
+from payments_service import service
+from payments_service.fastjson import JSONResponse
+from payments_service import ravepay_views
+from payments_service.outbox import outbox
+
+
+def home(request: Request):
+    return JSONResponse({"hello": "world"})
+
+
+def metrics_view(request: Request):
+    return PlainTextResponse(
+        metrics.registry.render(), media_type="text/plain; version=0.0.4"
+    )
+
+
+async def provider_unavailable(request: Request, exc: breaker.CircuitOpenError):
+    return JSONResponse(
+        {"status": False, "msg": f"{exc.host} is temporarily unavailable"},
+        status_code=503,
+        headers={"Retry-After": str(math.ceil(exc.retry_after))},
+    )
+
+
+exception_handlers = {
+    breaker.CircuitOpenError: provider_unavailable,
+}
+
+routes = [
+    Route("/", home),
+    Route("/metrics", metrics_view),
+    # Route("/credentials", payment_credentials),
+    Route("/webhook", ravepay_views.webhook_callback, methods=["POST"]),
+    Route("/verify-payment/{identifier}", ravepay_views.verify_payment),
+    Route(
+        "/verify-payments/{identifier}",
+        ravepay_views.verify_payments,
+        methods=["POST"],
+    ),
+    Route(
+        "/generate-account-no/{identifier}",
+        ravepay_views.generate_payment_account_no,
+        methods=["POST"],
+    ),
+    Route(
+        "/build-payment-info/{identifier}",
+        ravepay_views.client_payment_object,
+        methods=["POST"],
+    ),
+    Mount("/ravepay", routes=ravepay_views.routes),
+]
+
+middlewares = [
+    Middleware(metrics.MetricsMiddleware),
+    Middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_headers=["*"],
+        allow_methods=["*"],
+        allow_credentials=True,
+    ),
+    Middleware(ratelimit.RateLimitMiddleware, routes=routes),
+]
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    await service.credential_backend.start()
+    outbox.ensure_started()
+    yield
+    await outbox.stop()
+    await service.credential_backend.stop()
+
+
+app = Starlette(
+    middleware=middlewares,
+    routes=routes,
+    exception_handlers=exception_handlers,
+    lifespan=lifespan,
+)
@@ -0,0 +1,21 @@
+"""Receivers that hand verified webhook payloads to the tenant's callback.
+
+Imported by the adapters whose webhooks send ravepay's signals, so the
+receivers are connected before the first webhook is verified."""
+
+from dispatch import receiver
+from ravepay.api import signals
+
+
+@receiver(signals.successful_payment_signal)
+def payment_signal(sender, **kwargs):
+    callback_func = kwargs.pop("callback_func")
+    signal = kwargs.pop("signal")
+    callback_func(kwargs)
+
+
+@receiver(signals.event_signal)
+def event_signal(sender, **kwargs):
+    callback_func = kwargs.pop("callback_func")
+    signal = kwargs.pop("signal")
+    callback_func(kwargs)
@@ -0,0 +1,54 @@
+import pytest
+from starlette.testclient import TestClient
+
+from payments_service.breaker import CircuitOpenError, HostHealth
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_circuit_opens_on_errors_and_closes_after_a_good_probe():
+    clock = Clock()
+    health = HostHealth("api.flutterwave.com", min_calls=4, open_for=10, timer=clock)
+    for failed in (False, True, True, True):
+        health.check()
+        health.record(failed, 0.1)
+    with pytest.raises(CircuitOpenError):
+        health.check()
+
+    clock.now = 11
+    health.check()
+    # Only one probe is let through while it is in flight.
+    with pytest.raises(CircuitOpenError):
+        health.check()
+    health.record(False, 0.1)
+    health.check()
+    assert not health.is_open
+
+
+def test_read_timeout_follows_recent_latency():
+    health = HostHealth("api.paystack.co")
+    assert health.timeout((3.05, 30)) == (3.05, 30)
+    for _ in range(50):
+        health.record(False, 1.5)
+    assert health.timeout((3.05, 30)) == (3.05, 6.0)
+
+
+def test_open_circuit_returns_503(client: TestClient, payment_instance):
+    mock_service, mock_instance = payment_instance
+    mock_instance.instance.async_verify_payment.side_effect = CircuitOpenError(
+        "api.flutterwave.com", 7.2
+    )
+    response = client.get(
+        "/verify-payment/flutterwave_dev", params={"amount": 4000, "txref": "ADE"}
+    )
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "8"
+    assert response.json() == {
+        "status": False,
+        "msg": "api.flutterwave.com is temporarily unavailable",
+    }
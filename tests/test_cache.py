@@ -0,0 +1,78 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from payments_service.cache import TTLCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl():
+    timer = FakeTimer()
+    cache = TTLCache(maxsize=10, ttl=5, timer=timer)
+    cache.set("ravepay_dev", {"id": "ravepay_dev"})
+    assert cache.get("ravepay_dev") == {"id": "ravepay_dev"}
+    timer.now = 5
+    assert cache.get("ravepay_dev") is None
+    assert len(cache) == 0
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TTLCache(maxsize=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_concurrent_misses_share_a_single_fetch():
+    cache = TTLCache(maxsize=10, ttl=60)
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"id": "paystack_dev"}
+
+    async def main():
+        return await asyncio.gather(
+            *[cache.get_or_fetch("paystack_dev", fetch) for _ in range(20)]
+        )
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result == {"id": "paystack_dev"} for result in results)
+    assert cache.get("paystack_dev") == {"id": "paystack_dev"}
+
+
+def test_missing_results_are_not_cached():
+    cache = TTLCache(maxsize=10, ttl=60)
+
+    async def fetch():
+        return None
+
+    assert asyncio.run(cache.get_or_fetch("unknown", fetch)) is None
+    assert "unknown" not in cache
+
+
+def test_cache_can_be_shared_between_threads():
+    cache = TTLCache(maxsize=8, ttl=60)
+
+    def churn(worker):
+        for i in range(2000):
+            key = (worker + i) % 16
+            cache.set(key, i)
+            cache.get(key)
+            cache.pop((key + 1) % 16)
+
+    with ThreadPoolExecutor(8) as pool:
+        list(pool.map(churn, range(8)))
+    assert len(cache) <= 8
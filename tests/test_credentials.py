@@ -0,0 +1,195 @@
+import asyncio
+import json
+import os
+import stat
+
+import pytest
+import requests
+
+from payments_service import credentials, service, transport
+from payments_service.cache import TTLCache
+
+
+class FakeSheet(credentials.CredentialBackend):
+    def __init__(self, rows):
+        self.rows = rows
+
+    def all(self):
+        return self.rows
+
+
+def test_sheet_rows_are_imported_into_sqlite(tmp_path):
+    store = credentials.SQLiteBackend(str(tmp_path / "credentials.sqlite3"))
+    rows = [
+        {"id": "stripe_dev", "type": "stripe", "secret_key": "sk_test"},
+        {"id": "paystack_dev", "type": "paystack", "secret_key": "sk_test"},
+    ]
+    assert credentials.import_rows(FakeSheet(rows), store) == 2
+    assert store.get("stripe_dev") == rows[0]
+    assert store.get("unknown") is None
+
+    credentials.import_rows(FakeSheet(rows[1:]), store)
+    assert store.get("stripe_dev") is None
+    assert [row["id"] for row in store.all()] == ["paystack_dev"]
+
+
+def test_local_store_is_only_readable_by_its_owner(tmp_path):
+    path = tmp_path / "state" / "credentials.sqlite3"
+    store = credentials.SQLiteBackend(str(path))
+    store.replace_all([{"id": "stripe_dev", "type": "stripe"}])
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(path.parent).st_mode) == 0o700
+
+
+def test_tenants_are_resolved_from_the_local_store(tmp_path, monkeypatch):
+    store = credentials.SQLiteBackend(str(tmp_path / "credentials.sqlite3"))
+    store.replace_all([{"id": "stripe_dev", "type": "stripe", "test": "TRUE"}])
+    monkeypatch.setattr(service, "credential_backend", store)
+    monkeypatch.setattr(service, "credential_cache", TTLCache(ttl=60))
+
+    tenant = asyncio.run(service.get_tenant("stripe_dev"))
+    assert tenant.kind == "stripe"
+    assert tenant.test is True
+    assert asyncio.run(service.get_tenant("unknown")) is None
+
+
+def test_snapshot_keeps_serving_when_the_sheet_is_down(monkeypatch):
+    class Sheet(FakeSheet):
+        down = False
+
+        def all(self):
+            if self.down:
+                raise ConnectionError("sheet service unavailable")
+            return self.rows
+
+        def get(self, identifier):
+            return {row["id"]: row for row in self.rows}.get(identifier)
+
+    sheet = Sheet([{"id": "stripe_dev", "type": "stripe"}])
+    snapshot = credentials.SnapshotBackend(sheet, interval=60)
+    monkeypatch.setattr(service, "credential_backend", snapshot)
+    monkeypatch.setattr(service, "credential_cache", TTLCache(ttl=0))
+
+    async def main():
+        await snapshot.start()
+        sheet.down = True
+        sheet.rows = sheet.rows + [{"id": "paystack_dev", "type": "paystack"}]
+        await snapshot._refresh()
+        stripe = await service.get_tenant("stripe_dev")
+        paystack = await service.get_tenant("paystack_dev")
+        await snapshot.stop()
+        return stripe, paystack
+
+    stripe, paystack = asyncio.run(main())
+    assert stripe.kind == "stripe"
+    # Not in the snapshot yet, so it came from the sheet itself.
+    assert paystack.kind == "paystack"
+    assert list(snapshot.rows) == ["stripe_dev"]
+
+
+def test_unknown_identifiers_are_looked_up_once(monkeypatch):
+    class Sheet(FakeSheet):
+        lookups = 0
+
+        def get(self, identifier):
+            self.lookups += 1
+            return None
+
+    sheet = Sheet([])
+    monkeypatch.setattr(service, "credential_backend", sheet)
+    monkeypatch.setattr(service, "credential_cache", TTLCache(ttl=60))
+    monkeypatch.setattr(service, "unknown_tenants", TTLCache(ttl=60))
+
+    assert service.tenant_known("junk") is True
+    assert asyncio.run(service.get_tenant("junk")) is None
+    assert asyncio.run(service.get_tenant("junk")) is None
+    assert sheet.lookups == 1
+    assert service.tenant_known("junk") is False
+    assert service.tenant_known(None) is False
+
+
+def test_sheet_errors_are_not_remembered_as_unknown_tenants(monkeypatch):
+    def sheet_response(status_code, data=None):
+        response = requests.Response()
+        response.status_code = status_code
+        response._content = json.dumps({"data": data}).encode()
+        return response
+
+    responses = [
+        sheet_response(503),
+        sheet_response(200, {"id": "stripe_dev", "type": "stripe"}),
+    ]
+    monkeypatch.setattr(transport, "request", lambda *a, **kw: responses.pop(0))
+    sheet = credentials.SheetBackend("http://sheet", "tenants")
+    monkeypatch.setattr(service, "credential_backend", sheet)
+    monkeypatch.setattr(service, "credential_cache", TTLCache(ttl=60))
+    monkeypatch.setattr(service, "unknown_tenants", TTLCache(ttl=60))
+
+    with pytest.raises(requests.HTTPError):
+        asyncio.run(service.get_tenant("stripe_dev"))
+    assert service.tenant_known("stripe_dev") is True
+    assert asyncio.run(service.get_tenant("stripe_dev")).kind == "stripe"
+
+
+def test_snapshot_rejects_identifiers_it_does_not_hold(monkeypatch):
+    sheet = FakeSheet([{"id": "stripe_dev", "type": "stripe"}])
+    snapshot = credentials.SnapshotBackend(sheet)
+    monkeypatch.setattr(service, "credential_backend", snapshot)
+    monkeypatch.setattr(service, "unknown_tenants", TTLCache(ttl=60))
+    service.unknown_tenants.set("paystack_dev", True)
+
+    assert snapshot.knows("stripe_dev") is None
+    snapshot.refresh()
+    assert service.tenant_known("stripe_dev") is True
+    assert service.tenant_known("junk") is False
+
+    sheet.rows = sheet.rows + [{"id": "paystack_dev", "type": "paystack"}]
+    snapshot.refresh()
+    # The refreshed snapshot wins over the earlier failed lookup.
+    assert service.tenant_known("paystack_dev") is True
+
+
+def test_workers_share_one_snapshot_file(tmp_path):
+    class Sheet(FakeSheet):
+        reads = 0
+
+        def all(self):
+            self.reads += 1
+            return self.rows
+
+    sheet = Sheet([{"id": "stripe_dev", "type": "stripe"}])
+    path = str(tmp_path / "credentials.json")
+    workers = [credentials.SharedSnapshotBackend(sheet, path) for _ in range(3)]
+
+    assert [worker.refresh() for worker in workers] == [1, 1, 1]
+    assert sheet.reads == 1
+    assert workers[2].get("stripe_dev") == {"id": "stripe_dev", "type": "stripe"}
+
+    sheet.rows = sheet.rows + [{"id": "paystack_dev", "type": "paystack"}]
+    workers[0].invalidate()
+    assert workers[1].sync() is True
+    assert workers[2].sync() is True
+    assert sheet.reads == 2
+    assert workers[2].knows("paystack_dev") is True
+
+    # A restarted worker starts from the file instead of the sheet.
+    restarted = credentials.SharedSnapshotBackend(sheet, path)
+    assert restarted.refresh() == 2
+    assert sheet.reads == 2
+
+
+def test_shared_snapshot_state_is_private_and_bad_files_are_ignored(tmp_path):
+    sheet = FakeSheet([{"id": "stripe_dev", "type": "stripe"}])
+    path = tmp_path / "credentials.json"
+    worker = credentials.SharedSnapshotBackend(sheet, str(path))
+    worker.refresh()
+    worker.invalidate()
+    state = tmp_path / "credentials.json.d"
+    assert stat.S_IMODE(os.stat(state).st_mode) == 0o700
+    assert sorted(os.listdir(state)) == ["invalidated", "lock"]
+
+    for content in ['{"rows": []}', '{"loaded_at": 1, "rows": [1]}', "[]"]:
+        path.write_text(content)
+        other = credentials.SharedSnapshotBackend(sheet, str(path))
+        assert other.load() is False
+        assert other.rows == {}
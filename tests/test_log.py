@@ -0,0 +1,34 @@
+import io
+import json
+import logging
+
+from payments_service import log
+
+
+def test_records_are_written_off_thread_with_secrets_redacted():
+    stream = io.StringIO()
+    log.configure(level="DEBUG", sample_rates={"DEBUG": 0}, stream=stream)
+    logger = logging.getLogger("payments_service.service")
+    for _ in range(100):
+        logger.debug("sheet lookup", extra={"identifier": "ravepay_dev"})
+    logger.info(
+        "sheet lookup",
+        extra={"data": {"id": "ravepay_dev", "secret_key": "sk_live_123"}},
+    )
+    log.shutdown()
+
+    [line] = stream.getvalue().splitlines()
+    entry = json.loads(line)
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "payments_service.service"
+    assert entry["data"] == {"id": "ravepay_dev", "secret_key": "***"}
+    assert "sk_live_123" not in line
+    log.configure()
+
+
+def test_full_queue_drops_records_instead_of_blocking():
+    handler = log.DroppingQueueHandler(log.queue.Queue(1))
+    record = logging.LogRecord("payments_service", logging.INFO, "", 0, "x", (), None)
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.dropped == 1
@@ -0,0 +1,45 @@
+from starlette.testclient import TestClient
+
+from payments_service import metrics
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = metrics.Registry()
+    histogram = registry.histogram(
+        "latency_seconds", "Latency.", ("kind",), buckets=(0.1, 1)
+    )
+    histogram.observe(0.05, kind="stripe")
+    histogram.observe(0.5, kind="stripe")
+    histogram.observe(5, kind="stripe")
+    assert registry.render().splitlines() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{kind="stripe",le="0.1"} 1',
+        'latency_seconds_bucket{kind="stripe",le="1.0"} 2',
+        'latency_seconds_bucket{kind="stripe",le="+Inf"} 3',
+        'latency_seconds_sum{kind="stripe"} 5.55',
+        'latency_seconds_count{kind="stripe"} 3',
+    ]
+
+
+def test_requests_are_recorded_by_route_and_kind(client: TestClient, payment_instance):
+    mock_service, mock_instance = payment_instance
+
+    async def build_payment_instance(identifier):
+        metrics.current_kind.set("paystack")
+        return mock_instance
+
+    mock_service.build_payment_instance.side_effect = build_payment_instance
+    mock_instance.instance.async_verify_payment.return_value = [True, "Successful"]
+    labels = dict(route="verify_payment", method="GET", status="200")
+    before = metrics.request_duration.count(kind="paystack", **labels)
+    client.get(
+        "/verify-payment/paystack_dev",
+        params={"amount": 4000, "txref": "ADESDESD", "amount_only": "true"},
+    )
+    assert metrics.request_duration.count(kind="paystack", **labels) == before + 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert "payments_request_duration_seconds_bucket" in response.text
+    assert "payments_outbox_pending" in response.text
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import stat
+
+from payments_service import transport
+from payments_service.outbox import Outbox
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+def test_callbacks_are_retried_then_dead_lettered(tmp_path, monkeypatch):
+    calls = []
+
+    async def fake_request(method, url, **kwargs):
+        calls.append((url, kwargs["json"]))
+        return FakeResponse(500 if "failing" in url else 200)
+
+    monkeypatch.setattr(transport, "async_request", fake_request)
+    box = Outbox(
+        str(tmp_path / "outbox.sqlite3"),
+        base_delay=0.01,
+        max_delay=0.02,
+        max_attempts=3,
+    )
+
+    event = {"event": "charge.completed"}
+
+    async def main():
+        box.ensure_started()
+        box.enqueue("http://merchant.test/hook", event)
+        box.enqueue("http://failing.test/hook", event)
+        await asyncio.sleep(0.5)
+        await box.stop()
+
+    asyncio.run(main())
+    assert calls.count(("http://merchant.test/hook", event)) == 1
+    assert calls.count(("http://failing.test/hook", event)) == 3
+    assert box.pending() == 0
+    [dead] = box.dead_letters()
+    assert dead["url"] == "http://failing.test/hook"
+    assert dead["attempts"] == 3
+    assert dead["last_error"] == "HTTP 500"
+
+
+def test_callbacks_survive_until_a_worker_runs(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    Outbox(path).enqueue("http://merchant.test/hook", {"event": "charge.completed"})
+    assert Outbox(path).pending() == 1
+
+
+def test_outbox_is_only_readable_by_its_owner(tmp_path):
+    path = str(tmp_path / "outbox.sqlite3")
+    open(path, "w").close()
+    os.chmod(path, 0o644)
+    Outbox(path).enqueue("http://merchant.test/hook", {"event": "charge.completed"})
+    for name in os.listdir(tmp_path):
+        mode = stat.S_IMODE(os.stat(tmp_path / name).st_mode)
+        assert mode == 0o600, name
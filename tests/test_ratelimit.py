@@ -0,0 +1,67 @@
+from starlette.testclient import TestClient
+
+from payments_service import ratelimit
+from payments_service.cache import TTLCache
+from payments_service.tenants import TenantRecord
+
+
+class Clock:
+    now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_refills_at_the_configured_rate():
+    clock = Clock()
+    limiter = ratelimit.RateLimiter(timer=clock)
+    assert [limiter.acquire(("a", "r"), 2, 2) for _ in range(2)] == [0, 0]
+    assert limiter.acquire(("a", "r"), 2, 2) == 0.5
+    # Other tenants and routes have their own buckets.
+    assert limiter.acquire(("b", "r"), 2, 2) == 0
+    assert limiter.acquire(("a", "other"), 2, 2) == 0
+    clock.now = 0.5
+    assert limiter.acquire(("a", "r"), 2, 2) == 0
+
+
+def test_limiter_keeps_only_recent_buckets():
+    limiter = ratelimit.RateLimiter(maxsize=2)
+    for identifier in "abc":
+        limiter.acquire((identifier, "r"), 1, 1)
+    assert len(limiter) == 2
+
+
+def test_tenants_over_their_limit_get_429(
+    client: TestClient, payment_instance, monkeypatch
+):
+    mock_service, mock_instance = payment_instance
+    mock_instance.instance.async_verify_payment.return_value = [True, "Successful"]
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.RateLimiter())
+    monkeypatch.setattr(ratelimit.service, "credential_cache", TTLCache(ttl=60))
+    row = {"id": "ravepay_dev", "type": "ravepay", "rate_limit": "0.5"}
+    ratelimit.service.credential_cache.set(
+        "ravepay_dev", TenantRecord.from_row({**row, "rate_limit_burst": "2"})
+    )
+    url = "/verify-payment/ravepay_dev?amount=4000&txref=ADESDESD&amount_only=true"
+
+    assert [client.get(url).status_code for _ in range(2)] == [200, 200]
+    response = client.get(url)
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "2"
+    assert response.json() == {"status": False, "msg": "Too many requests"}
+    # Routes under the /ravepay mount share the tenant's bucket for that route.
+    assert client.get("/ravepay" + url).status_code == 429
+    other = url.replace("ravepay_dev", "paystack_dev")
+    assert client.get(other).status_code == 200
+
+
+def test_tenants_without_a_limit_are_not_limited(
+    client: TestClient, payment_instance, monkeypatch
+):
+    mock_service, mock_instance = payment_instance
+    mock_instance.instance.async_verify_payment.return_value = [True, "Successful"]
+    monkeypatch.setattr(ratelimit, "limiter", ratelimit.RateLimiter())
+    monkeypatch.setattr(ratelimit.settings, "RATE_LIMIT", 0)
+    url = "/verify-payment/paystack_dev?amount=4000&txref=ADESDESD&amount_only=true"
+    assert {client.get(url).status_code for _ in range(5)} == {200}
+    assert len(ratelimit.limiter) == 0
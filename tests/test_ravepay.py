@@ -1,76 +1,247 @@
-import pytest
-from starlette.testclient import TestClient
-from unittest.mock import Mock
-
-
-def test_home_route(client: TestClient):
-    response = client.get("/")
-    assert response.status_code == 200
-    assert response.json() == {"hello": "world"}
-
-
-def test_verify_payment(client: TestClient, payment_instance):
-    mock_service, mock_instance = payment_instance
-    # Successful scenario with query parameters passed.
-    mock_instance.instance.verify_payment.return_value = [True, "Successful", {}]
-    response = client.get(
-        "/verify-payment/ravepay_dev", params={"amount": 4000, "txref": "ADESDESD"}
-    )
-    mock_service.build_payment_instance.assert_called_with("ravepay_dev")
-    mock_instance.instance.verify_payment.assert_called_with(
-        "ADESDESD", amount="4000", amount_only=False
-    )
-    assert response.status_code == 200
-    assert response.json() == {"status": True, "msg": "Successful", "data": {}}
-    # Failure Scenario 1 with query parameters passed
-    mock_instance.instance.verify_payment.return_value = [False, "Failed", {}]
-    response = client.get(
-        "/verify-payment/ravepay_dev", params={"amount": 4000, "txref": "ADESDESD"}
-    )
-    assert response.status_code == 200
-    assert response.json() == {
-        "status": False,
-        "msg": "Verification Failed",
-    }
-    # when corresponding query parameters are not passed
-    response = client.get("/verify-payment/ravepay_dev", params={})
-    assert response.status_code == 400
-    assert response.json() == {
-        "status": False,
-        "msg": "missing `amount` or `txref` query parameters",
-    }
-
-
-def test_client_payment_object(client: TestClient, payment_instance):
-    mock_service, mock_instance = payment_instance
-    mock_instance.instance.processor_info.return_value = {"hello": "world"}
-    mock_instance.instance.other_payment_info.return_value = {"others": True}
-    response = client.post(
-        "/build-payment-info/ravepay_dev",
-        json={
-            "amount": 4000,
-            "currency": "NGN",
-            "order": "ADESDESD",
-            "user": {},
-            "processor_info": {},
-        },
-    )
-    assert response.status_code == 200
-    assert response.json() == {
-        "status": True,
-        "data": {
-            "processor_button_info": {"others": True},
-            "payment_obj": {"hello": "world"},
-            "kind": "ravepay",
-        },
-    }
-    mock_instance.instance.processor_info.assert_called_with(
-        4000, redirect_url="http://www.google.com"
-    )
-    mock_instance.instance.other_payment_info.assert_called_with(
-        currency="NGN",
-        order="ADESDESD",
-        callback_url="http://www.google.com",
-        amount=4000,
-    )
-
+import pytest
+from starlette.testclient import TestClient
+from unittest.mock import AsyncMock, Mock
+
+from payments_service import ravepay_views, service
+from payments_service.cache import TTLCache
+from payments_service.views import app
+
+
+def test_home_route(client: TestClient):
+    response = client.get("/")
+    assert response.status_code == 200
+    assert response.json() == {"hello": "world"}
+
+
+def test_verify_payment(client: TestClient, payment_instance):
+    mock_service, mock_instance = payment_instance
+    # Successful scenario with query parameters passed.
+    mock_instance.instance.async_verify_payment.return_value = [
+        True,
+        "Successful",
+        {},
+    ]
+    response = client.get(
+        "/verify-payment/ravepay_dev", params={"amount": 4000, "txref": "ADESDESD"}
+    )
+    mock_service.build_payment_instance.assert_called_with("ravepay_dev")
+    mock_instance.instance.async_verify_payment.assert_called_with(
+        "ADESDESD", amount="4000", amount_only=False
+    )
+    assert response.status_code == 200
+    assert response.json() == {"status": True, "msg": "Successful", "data": {}}
+    # Failure Scenario 1 with query parameters passed
+    mock_instance.instance.async_verify_payment.return_value = [False, "Failed", {}]
+    response = client.get(
+        "/verify-payment/ravepay_dev", params={"amount": 4000, "txref": "ADESDESD"}
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "status": False,
+        "msg": "Verification Failed",
+    }
+    # when corresponding query parameters are not passed
+    response = client.get("/verify-payment/ravepay_dev", params={})
+    assert response.status_code == 400
+    assert response.json() == {
+        "status": False,
+        "msg": "missing `amount` or `txref` query parameters",
+    }
+
+
+def test_client_payment_object(client: TestClient, payment_instance):
+    mock_service, mock_instance = payment_instance
+    mock_instance.instance.processor_info.return_value = {"hello": "world"}
+    mock_instance.instance.async_other_payment_info.return_value = {"others": True}
+    response = client.post(
+        "/build-payment-info/ravepay_dev",
+        json={
+            "amount": 4000,
+            "currency": "NGN",
+            "order": "ADESDESD",
+            "user": {},
+            "processor_info": {},
+        },
+    )
+    assert response.status_code == 200
+    assert response.json() == {
+        "status": True,
+        "data": {
+            "processor_button_info": {"others": True},
+            "payment_obj": {"hello": "world"},
+            "kind": "ravepay",
+        },
+    }
+    mock_instance.instance.processor_info.assert_called_with(
+        4000, redirect_url="http://www.google.com"
+    )
+    mock_instance.instance.async_other_payment_info.assert_called_with(
+        currency="NGN",
+        order="ADESDESD",
+        callback_url="http://www.google.com",
+        amount=4000,
+    )
+
+
+def test_duplicate_webhooks_are_acknowledged_without_work(client: TestClient, mocker):
+    instance = Mock(async_verify_webhook=AsyncMock(return_value=("charge", {})))
+    build_payment_instance = mocker.patch(
+        "payments_service.service.build_payment_instance",
+        new=AsyncMock(return_value=Mock(instance=instance)),
+    )
+    mocker.patch.object(service, "webhook_events", TTLCache(maxsize=10, ttl=60))
+    body = {"event": "charge.completed", "data": {"id": 1, "tx_ref": "ADESDESD"}}
+    for _ in range(3):
+        response = client.post(
+            "/webhook", json=body, headers={"verif-hash": "ravepay_dev"}
+        )
+        assert response.status_code == 200
+        assert response.json() == {"status": "Success"}
+    build_payment_instance.assert_called_once_with("ravepay_dev")
+
+
+def test_forged_or_failed_webhooks_do_not_block_the_real_one(mocker):
+    verify = AsyncMock(
+        side_effect=[None, ConnectionError("provider down"), ("charge", {})]
+    )
+    mocker.patch(
+        "payments_service.service.build_payment_instance",
+        new=AsyncMock(return_value=Mock(instance=Mock(async_verify_webhook=verify))),
+    )
+    mocker.patch.object(service, "webhook_events", TTLCache(maxsize=10, ttl=60))
+    client = TestClient(app, raise_server_exceptions=False)
+    body = {"event": "charge.completed", "data": {"id": 1, "tx_ref": "ADESDESD"}}
+    for _ in range(4):
+        client.post("/webhook", json=body, headers={"verif-hash": "ravepay_dev"})
+    # The forged and the failed delivery were retried, the verified one was not.
+    assert verify.call_count == 3
+
+
+def test_webhook_body_is_parsed_once_and_passed_through(client: TestClient, mocker):
+    instance = Mock(async_verify_webhook=AsyncMock())
+    mocker.patch(
+        "payments_service.service.build_payment_instance",
+        new=AsyncMock(return_value=Mock(instance=instance)),
+    )
+    mocker.patch.object(service, "webhook_events", TTLCache(maxsize=10, ttl=60))
+    loads = mocker.spy(ravepay_views.fastjson, "loads")
+    body = {"event": "charge.completed", "data": {"id": 2, "tx_ref": "ADESDESD"}}
+    response = client.post("/webhook", json=body, headers={"verif-hash": "ravepay_dev"})
+    assert response.status_code == 200
+    assert loads.call_count == 1
+    signature, raw, payload = instance.async_verify_webhook.call_args.args
+    assert (signature, payload) == ("ravepay_dev", body)
+
+
+def test_webhooks_for_unknown_identifiers_are_rejected(client: TestClient, mocker):
+    build_payment_instance = mocker.patch(
+        "payments_service.service.build_payment_instance",
+        new=AsyncMock(return_value=None),
+    )
+    mocker.patch.object(service, "unknown_tenants", TTLCache(ttl=60))
+    service.unknown_tenants.set("junk", True)
+    for headers in ({"verif-hash": "junk"}, {}):
+        response = client.post("/webhook", json={"event": "x"}, headers=headers)
+        assert response.status_code == 404
+    build_payment_instance.assert_not_called()
+
+
+def test_verify_payments_in_batch(client: TestClient, payment_instance):
+    mock_service, mock_instance = payment_instance
+
+    async def verify_payment(ref, amount=None, amount_only=False):
+        if ref == "FAILED":
+            return [False, "Failed"]
+        if ref == "ACCEPTED":
+            # verify_result returns None for a 2xx other than 200.
+            return None
+        return [True, "Successful"]
+
+    mock_instance.instance.async_verify_payment.side_effect = verify_payment
+    payments = [{"txref": f"REF{i}", "amount": 4000} for i in range(50)]
+    payments.append({"txref": "FAILED", "amount": 4000})
+    payments.insert(1, {"txref": "ACCEPTED", "amount": 4000})
+    response = client.post(
+        "/verify-payments/ravepay_dev",
+        json={"payments": payments, "amount_only": True},
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert len(data) == 52
+    assert data[0] == {"txref": "REF0", "status": True, "msg": "Successful"}
+    assert data[1] == {
+        "txref": "ACCEPTED",
+        "status": False,
+        "msg": "Verification Failed",
+    }
+    assert data[-1] == {
+        "txref": "FAILED",
+        "status": False,
+        "msg": "Verification Failed",
+    }
+    mock_service.build_payment_instance.assert_called_once_with("ravepay_dev")
+
+    response = client.post("/verify-payments/ravepay_dev", json={"payments": []})
+    assert response.status_code == 400
+    for content in [b"{not json", b'"payments"', b"42"]:
+        response = client.post("/verify-payments/ravepay_dev", content=content)
+        assert response.status_code == 400
+        assert response.json() == {"status": False, "msg": "missing `payments`"}
+
+
+def test_final_verifications_are_cached(client: TestClient, payment_instance, mocker):
+    mock_service, mock_instance = payment_instance
+    mocker.patch.object(ravepay_views, "verification_cache", TTLCache(ttl=60))
+    verify = mock_instance.instance.async_verify_payment
+    params = {"amount": 4000, "amount_only": "true"}
+
+    verify.return_value = (False, "Could not verify transaction")
+    for _ in range(2):
+        response = client.get(
+            "/verify-payment/ravepay_dev", params={**params, "txref": "PENDING"}
+        )
+        assert response.json() == {"status": False, "msg": "Verification Failed"}
+    assert verify.call_count == 2
+
+    verify.reset_mock()
+    verify.return_value = (True, "Successful")
+    for _ in range(3):
+        response = client.get(
+            "/verify-payment/ravepay_dev", params={**params, "txref": "PAID"}
+        )
+        assert response.json() == {"status": True, "msg": "Successful"}
+    verify.assert_called_once_with("PAID", amount="4000", amount_only=True)
+
+
+def test_only_settled_transactions_are_cached(
+    client: TestClient, payment_instance, mocker
+):
+    from payments_service import flutterwave
+
+    payload = {"message": "Transaction fetched", "data": {"amount": 4000}}
+    payload["data"]["status"] = "pending"
+    response = Mock(status_code=200, json=Mock(return_value=payload))
+    result = flutterwave.Transaction(None).verify_result(response, amount="4000")
+    # The response is unchanged; only caching looks at the status.
+    assert result == (True, "Transaction fetched", payload["data"])
+    assert not ravepay_views.is_final_verification(result)
+
+    mock_service, mock_instance = payment_instance
+    mocker.patch.object(ravepay_views, "verification_cache", TTLCache(ttl=60))
+    verify = mock_instance.instance.async_verify_payment
+    params = {"amount": 4000, "amount_only": "true"}
+    for status, calls in [("pending", 3), ("failed", 1), ("reversed", 1)]:
+        verify.reset_mock()
+        verify.return_value = (True, "Transaction fetched", {"status": status})
+        for _ in range(3):
+            response = client.get(
+                "/verify-payment/ravepay_dev", params={**params, "txref": status}
+            )
+            assert response.json() == {"status": True, "msg": "Transaction fetched"}
+        assert verify.call_count == calls
+
+    verify.reset_mock()
+    verify.return_value = (False, "Could not verify", {"status": "failed"})
+    for _ in range(3):
+        client.get("/verify-payment/ravepay_dev", params={**params, "txref": "NO"})
+    assert verify.call_count == 1
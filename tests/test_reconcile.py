@@ -0,0 +1,145 @@
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from payments_service import reconcile
+
+
+def test_rows_are_read_lazily_from_csv_and_ndjson():
+    lines = iter(["identifier,txref,amount\n", "a,REF1,4000\n", "b,REF2,\n"])
+    rows = reconcile.read_rows(lines, "csv")
+    assert next(rows) == {"identifier": "a", "ref": "REF1", "amount": "4000"}
+    # Only the header and the first row have been consumed.
+    assert next(lines) == "b,REF2,\n"
+
+    ndjson = ['{"identifier": "a", "ref": "REF1", "amount": 4000}\n', "\n"]
+    assert list(reconcile.read_rows(ndjson, "ndjson")) == [
+        {"identifier": "a", "ref": "REF1", "amount": 4000}
+    ]
+
+
+def test_mismatches_are_streamed_and_tenants_resolved_once(mocker):
+    async def verify_payment(ref, amount=None, amount_only=True):
+        await asyncio.sleep(0)
+        return {
+            "OK": (True, "Verification successful"),
+            "SHORT": (False, 3000),
+            "MISSING": (False, "Could not verify transaction"),
+        }[ref]
+
+    instance = SimpleNamespace(
+        kind="paystack",
+        instance=SimpleNamespace(async_verify_payment=verify_payment),
+    )
+    build_payment_instance = mocker.patch.object(
+        reconcile.service,
+        "build_payment_instance",
+        new=AsyncMock(side_effect=lambda _id: instance if _id == "known" else None),
+    )
+    mocker.patch.object(reconcile.service, "credential_backend", AsyncMock())
+    refs = ["OK"] * 50 + ["SHORT", "MISSING"]
+    rows = [{"identifier": "known", "ref": ref, "amount": 4000} for ref in refs]
+    rows.append({"identifier": "junk", "ref": "OK", "amount": 4000})
+    output = io.BytesIO()
+
+    counts = asyncio.run(
+        reconcile.reconcile(iter(rows), output, concurrency=5, default_rate=0)
+    )
+
+    assert counts == {
+        "match": 50,
+        "amount_mismatch": 1,
+        "failed": 1,
+        "unknown_tenant": 1,
+    }
+    report = {
+        line["ref"] + line["identifier"]: line
+        for line in map(json.loads, output.getvalue().splitlines())
+    }
+    assert report["SHORTknown"]["actual_amount"] == 3000
+    assert report["MISSINGknown"]["msg"] == "Could not verify transaction"
+    assert report["OKjunk"]["status"] == "unknown_tenant"
+    assert len(report) == 3
+    assert build_payment_instance.call_count == 2
+
+
+def test_calls_to_each_provider_are_rate_limited(mocker):
+    now = [0.0]
+    reconciler = reconcile.Reconciler(rates={"stripe": 2})
+    reconciler.limiter.timer = lambda: now[0]
+
+    async def sleep(seconds):
+        now[0] += seconds
+
+    mocker.patch.object(reconcile.asyncio, "sleep", new=sleep)
+
+    async def main():
+        for kind in ["stripe"] * 3 + ["paystack"] * 10:
+            await reconciler.throttle(kind)
+
+    asyncio.run(main())
+    # Two calls fit in stripe's burst, the third waits for a token.
+    assert now[0] == 0.5
+
+
+def test_unusable_rows_are_reported_as_errors():
+    lines = [
+        '{"identifier": "a", "ref": "REF1"}\n',
+        "{not json\n",
+        '{"ref": "REF2"}\n',
+        "[1, 2]\n",
+    ]
+    rows = list(reconcile.read_rows(lines, "ndjson"))
+    assert [row.get("status") for row in rows] == [None, "error", "error", "error"]
+    assert [row.get("line") for row in rows[1:]] == [2, 3, 4]
+
+    csv_lines = ["identifier,ref,amount\n", ",REF1,4000\n"]
+    [row] = reconcile.read_rows(csv_lines, "csv")
+    assert row["status"] == "error"
+    assert row["line"] == 2
+
+
+def test_unsettled_transactions_are_not_matches():
+    pending = (True, "Verification successful", {"status": "pending"})
+    assert reconcile.classify(pending, 4000) == (
+        "pending",
+        {"msg": "Verification successful", "provider_status": "pending"},
+    )
+    # Rows without an amount are still checked against the status.
+    failed = (True, "Verification successful", {"status": "failed"})
+    assert reconcile.classify(failed)[0] == "failed"
+    stripe_open = (False, "Failed", {"status": "failed"}, None)
+    assert reconcile.classify(stripe_open)[0] == "failed"
+    assert reconcile.classify((False, 20.0)) == (
+        "amount_mismatch",
+        {"actual_amount": 20.0},
+    )
+
+
+def test_amounts_are_compared_against_the_transaction():
+    stripe_paid = (True, "Successful", {"status": "success", "amount": 40.0})
+    assert reconcile.classify(stripe_paid, "40") == ("match", {})
+    assert reconcile.classify(stripe_paid, "30") == (
+        "amount_mismatch",
+        {"actual_amount": 40.0},
+    )
+    assert reconcile.classify(stripe_paid) == ("match", {})
+
+
+def test_failed_tenant_lookups_are_retried(mocker):
+    instance = SimpleNamespace(kind="stripe")
+    lookup = AsyncMock(side_effect=[ConnectionError("sheet down"), instance])
+    mocker.patch.object(reconcile.service, "build_payment_instance", new=lookup)
+    reconciler = reconcile.Reconciler()
+
+    async def main():
+        try:
+            await reconciler.payment_instance("known")
+        except ConnectionError:
+            pass
+        return await reconciler.payment_instance("known")
+
+    assert asyncio.run(main()) is instance
+    assert lookup.call_count == 2
@@ -0,0 +1,65 @@
+import json
+import subprocess
+import sys
+
+import pytest
+
+from payments_service import service
+from payments_service.tenants import TenantRecord
+
+
+def stripe_row(**kwargs):
+    return {
+        "id": "stripe_dev",
+        "type": "stripe",
+        "public_key": "pk_test",
+        "secret_key": "sk_test",
+        "test": "TRUE",
+        "webhook_url": "http://example.com/hook",
+        **kwargs,
+    }
+
+
+def test_tenant_record_is_parsed_once_and_immutable():
+    tenant = TenantRecord.from_row(stripe_row())
+    assert tenant.identifier == "stripe_dev"
+    assert tenant.kind == "stripe"
+    assert tenant.test is True
+    with pytest.raises(AttributeError):
+        tenant.secret_key = "sk_live"
+
+
+def test_adapter_is_reused_until_credentials_change(mocker):
+    factory = mocker.Mock(side_effect=lambda tenant: object())
+    mocker.patch.dict(service.adapter_factories, {"stripe": factory})
+    mocker.patch.dict(service._adapters, clear=True)
+
+    adapter = service.PaymentInstance(stripe_row()).instance
+    assert service.PaymentInstance(stripe_row()).instance is adapter
+    assert factory.call_count == 1
+
+    rotated = service.PaymentInstance(stripe_row(secret_key="sk_rotated"))
+    assert rotated.instance is not adapter
+    assert factory.call_count == 2
+
+
+def test_registry_imports_provider_on_first_use(mocker):
+    registry = service.ProviderRegistry({"fake": "json:loads"})
+    import_module = mocker.spy(service.importlib, "import_module")
+
+    assert registry.get("missing") is None
+    assert import_module.call_count == 0
+    assert registry["fake"] is json.loads
+    assert registry.get("fake") is json.loads
+    import_module.assert_called_once_with("json")
+
+
+def test_importing_the_app_imports_no_provider_sdk():
+    code = (
+        "import sys, payments_service.views; "
+        "print(sorted({'stripe', 'paystack', 'ravepay'} & set(sys.modules)))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
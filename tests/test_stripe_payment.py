@@ -0,0 +1,251 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+import stripe
+from starlette.testclient import TestClient
+
+from payments_service import breaker, stripe_payment, transport
+from payments_service.cache import TTLCache
+from payments_service.stripe_payment import StripeCatalog, StripeProcessor
+
+
+def price(id, product, unit_amount, interval_count, currency="usd", active=True):
+    return {
+        "id": id,
+        "product": product,
+        "unit_amount": unit_amount,
+        "currency": currency,
+        "active": active,
+        "recurring": {"interval": "day", "interval_count": interval_count},
+    }
+
+
+def test_catalog_indexes_plans_by_name_currency_and_duration():
+    products = [{"id": f"prod_{i}", "name": f"Plan {i}"} for i in range(500)]
+    prices = [
+        price("price_new", "prod_499", 5000, 30),
+        price("price_old", "prod_499", 4000, 30),
+        price("price_yearly", "prod_499", 50000, 365),
+        price("price_inactive", "prod_1", 1000, 30, active=False),
+        price("price_orphan", "prod_missing", 1000, 30),
+    ]
+    catalog = StripeCatalog().load(products, prices)
+
+    assert catalog.product("plan 499") == {"id": "prod_499", "name": "Plan 499"}
+    assert catalog.plan("PLAN 499", "USD", 30)["id"] == "price_new"
+    assert catalog.plan("Plan 499", "usd", 365)["id"] == "price_yearly"
+    assert catalog.plan("Plan 499")["id"] == "price_new"
+    assert catalog.plan("Plan 1") is None
+    assert len(catalog.plans) == 3
+
+
+def test_catalog_prefers_replacement_plans():
+    catalog = StripeCatalog().load(
+        [{"id": "prod_1", "name": "Basic"}], [price("price_1", "prod_1", 1000, 30)]
+    )
+    catalog.add_plan(
+        {
+            "id": "price_2",
+            "name": "Basic",
+            "amount": 2000,
+            "duration": 30,
+            "currency": "usd",
+        },
+        replace=True,
+    )
+    assert catalog.plan("basic", "usd", 30)["id"] == "price_2"
+
+
+class FakeStripeSession:
+    """Stands in for the requests session behind a tenant's Stripe client and
+    answers as whichever account the request was authenticated as."""
+
+    def request(self, method, url, headers=None, **kwargs):
+        secret_key = headers["Authorization"].split(" ", 1)[1]
+        time.sleep(0.001)
+        body = {
+            "id": url.rsplit("/", 1)[-1],
+            "object": "checkout.session",
+            "status": "complete",
+            "amount_total": 400000,
+            "subscription": None,
+            "customer": f"cus_{secret_key}",
+        }
+        return Mock(status_code=200, content=json.dumps(body).encode(), headers={})
+
+
+def test_stripe_keys_do_not_leak_between_tenants(monkeypatch):
+    monkeypatch.setattr(transport, "build_session", FakeStripeSession)
+    processors = [
+        StripeProcessor(f"sk_test_{i}", f"stripe_{i}", f"pk_test_{i}") for i in range(8)
+    ]
+
+    def verify(i):
+        processor = processors[i % len(processors)]
+        result = processor.verify_successful_session({"session_id": f"cs_{i}"})
+        return processor.secret_key, result["customer"]
+
+    with ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(verify, range(400)))
+
+    assert stripe.api_key is None
+    for secret_key, customer in results:
+        assert customer == f"cus_{secret_key}"
+
+
+def test_verified_sessions_come_with_their_summary(
+    client: TestClient, payment_instance, monkeypatch
+):
+    monkeypatch.setattr(transport, "build_session", FakeStripeSession)
+    api = stripe_payment.StripeAPI(
+        public_key="pk_test", secret_key="sk_test", django=False, id="stripe_dev"
+    )
+    mock_service, mock_instance = payment_instance
+    mock_instance.instance.async_verify_payment = AsyncMock(
+        side_effect=lambda code, **kwargs: api.verify_payment(code, **kwargs)
+    )
+    params = {"txref": "cs_1", "amount": 3000}
+
+    # The session's amount is not compared, as before.
+    response = client.get(
+        "/verify-payment/stripe_dev", params={**params, "amount_only": "true"}
+    )
+    assert response.json() == {"status": True, "msg": "Successful"}
+    response = client.get("/verify-payment/stripe_dev", params=params)
+    assert response.json()["data"]["amount"] == 4000.0
+    assert response.json()["data"]["customer"] == "cus_sk_test"
+
+
+def test_invoice_webhooks_use_subscriptions_cached_from_events(monkeypatch):
+    monkeypatch.setattr(stripe_payment, "subscription_cache", TTLCache(ttl=60))
+    processor = StripeProcessor("sk_test", "stripe_dev", "pk_test")
+    processor.client = Mock()
+    subscription = {
+        "id": "sub_1",
+        "status": "active",
+        "currency": "usd",
+        "current_period_start": 1700000000,
+        "current_period_end": 1702592000,
+    }
+    invoice = {
+        "id": "in_1",
+        "subscription": "sub_1",
+        "customer": "cus_1",
+        "customer_email": "a@example.com",
+        "customer_name": "A",
+        "customer_phone": None,
+        "status": "paid",
+        "currency": "usd",
+        "amount_paid": 5000,
+    }
+
+    processor.construct_event(
+        {
+            "body": {
+                "type": "customer.subscription.updated",
+                "data": {"object": subscription},
+            }
+        }
+    )
+    event = processor.construct_event(
+        {"body": {"type": "invoice.paid", "data": {"object": invoice}}}
+    )
+
+    processor.client.subscriptions.retrieve.assert_not_called()
+    assert event["data"]["subscription"]["status"] == "active"
+
+
+def test_signed_events_are_verified_and_parsed_once(mocker):
+    loads = mocker.spy(stripe_payment.fastjson, "loads")
+    processor = StripeProcessor("sk_test", "stripe_dev", "pk_test")
+    body = json.dumps(
+        {"type": "payment_intent.created", "data": {"object": {"id": "pi_1"}}}
+    )
+    timestamp = int(time.time())
+    signature = stripe.WebhookSignature._compute_signature(
+        f"{timestamp}.{body}", "whsec_test"
+    )
+    event = {"body": body, "webhook_secret": "whsec_test"}
+
+    processor.construct_event({**event, "sig": f"t={timestamp},v1={signature}"})
+    loads.assert_called_once_with(body)
+    with pytest.raises(ValueError, match="Webhook Error"):
+        processor.construct_event({**event, "sig": f"t={timestamp},v1=bad"})
+    assert loads.call_count == 1
+
+
+def test_provisioning_is_concurrent_idempotent_and_reported(monkeypatch):
+    monkeypatch.setattr(stripe_payment, "webhook_endpoint_cache", TTLCache(ttl=60))
+    processor = StripeProcessor("sk_test", "stripe_dev", "pk_test")
+    processor.client = Mock()
+    processor.client.products.list.return_value.auto_paging_iter.return_value = [
+        {"id": "prod_basic", "name": "Basic"}
+    ]
+    processor.client.prices.list.return_value.auto_paging_iter.return_value = [
+        price("price_basic", "prod_basic", 1000, 30)
+    ]
+    processor.client.products.create.side_effect = lambda params, options: (
+        SimpleNamespace(id=f"prod_{params['name'].lower()}", name=params["name"])
+    )
+
+    def create_price(params, options):
+        if params["unit_amount"] == 99900:
+            raise stripe.InvalidRequestError("amount too large", "unit_amount")
+        return SimpleNamespace(
+            id=options["idempotency_key"],
+            unit_amount=params["unit_amount"],
+            currency=params["currency"],
+            recurring={"interval": "day", "interval_count": 30},
+        )
+
+    processor.client.prices.create.side_effect = create_price
+    plans = [
+        {"name": "Basic", "amount": 10, "currency": "usd", "duration": 30},
+        {"name": "Pro", "amount": 20, "currency": "usd", "duration": 30},
+        {"name": "Pro", "amount": 20, "currency": "eur", "duration": 30},
+        {"name": "Max", "amount": 999, "currency": "usd", "duration": 30},
+        {"name": "pro", "amount": 20, "currency": "USD", "duration": 30},
+    ]
+    report = processor.provision(plans)
+
+    assert [item["status"] for item in report] == [
+        "exists",
+        "created",
+        "created",
+        "failed",
+        "created",
+    ]
+    # The repeated Pro/usd plan was only sent to Stripe once.
+    assert processor.client.prices.create.call_count == 3
+    assert report[4]["plan"] == report[1]["plan"]
+    assert report[0]["plan"]["id"] == "price_basic"
+    assert "amount too large" in report[3]["error"]
+    # One product per name, even though two Pro plans ran concurrently.
+    assert processor.client.products.create.call_count == 2
+    # A retried run sends the same idempotency keys.
+    assert report[1]["plan"]["id"] == stripe_payment.idempotency_key(
+        "stripe_dev", "price", "prod_pro", "usd", 30, 2000
+    )
+
+    endpoints = processor.client.webhook_endpoints
+    endpoints.list.return_value.auto_paging_iter.return_value = []
+    endpoints.create.side_effect = lambda params, options: Mock(url=params["url"])
+    for _ in range(3):
+        processor.create_webhook("https://example.com/stripe")
+    endpoints.list.assert_called_once()
+    endpoints.create.assert_called_once()
+
+
+def test_open_circuits_are_not_wrapped_by_stripe():
+    session = Mock()
+    session.request.side_effect = breaker.CircuitOpenError("api.stripe.com", 5)
+    client = stripe_payment.HTTPClient(session=session)
+    with pytest.raises(breaker.CircuitOpenError):
+        client.request_with_retries(
+            "get", "https://api.stripe.com/v1/prices", {}, max_network_retries=2
+        )
+    session.request.assert_called_once()
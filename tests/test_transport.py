@@ -0,0 +1,101 @@
+import asyncio
+import time
+from unittest.mock import Mock
+
+from payments_service import breaker, settings, transport
+
+
+def slow_then_fast(monkeypatch, host):
+    health = breaker.HostHealth(host)
+    for _ in range(50):
+        health.record(False, 0.01)
+    monkeypatch.setattr(breaker, "host_health", lambda host: health)
+    monkeypatch.setattr(settings, "HEDGE_REQUESTS", True)
+    monkeypatch.setattr(settings, "HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(transport, "hedge_budget", transport.HedgeBudget(0.1, 1))
+
+
+def test_slow_reads_are_hedged_and_the_first_answer_wins(monkeypatch):
+    slow_then_fast(monkeypatch, "api.flutterwave.com")
+    calls = []
+
+    async def fake_request(method, url, **kwargs):
+        calls.append(url)
+        if len(calls) == 1:
+            await asyncio.sleep(5)
+            return "slow"
+        return "fast"
+
+    monkeypatch.setattr(transport, "async_request", fake_request)
+    url = "https://api.flutterwave.com/v3/transactions/1/verify"
+    assert asyncio.run(transport.hedged_request("GET", url)) == "fast"
+    assert len(calls) == 2
+
+    # The budget only allowed one hedge, so the next read waits it out.
+    async def main():
+        calls.clear()
+        return await asyncio.wait_for(transport.hedged_request("GET", url), 0.2)
+
+    try:
+        asyncio.run(main())
+    except asyncio.TimeoutError:
+        pass
+    assert len(calls) == 1
+
+
+def test_blocking_reads_are_hedged(monkeypatch):
+    slow_then_fast(monkeypatch, "api.stripe.com")
+    calls = []
+
+    def retrieve(session_id):
+        calls.append(session_id)
+        if len(calls) == 1:
+            time.sleep(0.5)
+            return "slow"
+        return "fast"
+
+    assert transport.hedged_call("api.stripe.com", retrieve, "cs_test") == "fast"
+    assert calls == ["cs_test", "cs_test"]
+
+
+class FakeAsyncSession:
+    delays = [0.01]
+
+    async def request(self, method, url, **kwargs):
+        await asyncio.sleep(self.delays.pop(0) if len(self.delays) > 1 else 0.01)
+        return Mock(status_code=200)
+
+
+def test_a_call_cancelled_while_queued_does_not_hold_the_probe(monkeypatch):
+    now = [0.0]
+    health = breaker.HostHealth("api.paystack.co", min_calls=1, timer=lambda: now[0])
+    health.record(True, 0.01)
+    assert health.is_open
+    now[0] += health.open_for + 1
+    monkeypatch.setattr(breaker, "host_health", lambda host: health)
+    monkeypatch.setattr(transport, "get_async_session", FakeAsyncSession)
+    monkeypatch.setattr(settings, "HTTP_POOL_SIZE_PER_HOST", 1)
+    url = "https://api.paystack.co/transaction/verify/REF"
+
+    async def main():
+        async with transport._host_limit(url):
+            queued = asyncio.ensure_future(transport.async_request("GET", url))
+            await asyncio.sleep(0)
+            queued.cancel()
+        return await transport.async_request("GET", url)
+
+    assert asyncio.run(main()).status_code == 200
+    assert not health.is_open
+
+
+def test_cancelled_hedges_are_not_counted_as_failures(monkeypatch):
+    slow_then_fast(monkeypatch, "api.flutterwave.com")
+    health = breaker.host_health("api.flutterwave.com")
+    monkeypatch.setattr(transport, "get_async_session", FakeAsyncSession)
+    monkeypatch.setattr(FakeAsyncSession, "delays", [5, 0.01])
+    url = "https://api.flutterwave.com/v3/transactions/1/verify"
+
+    response = asyncio.run(transport.async_request("GET", url, hedge=True))
+    assert response.status_code == 200
+    assert health._failures == 0
+    assert len(health._outcomes) == 51